@@ -1,17 +1,35 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash
+from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash, stream_with_context
+import base64
+import hmac
+import io
+import json
 import os
-from dotenv import load_dotenv
-from werkzeug.utils import secure_filename
+import time
+import uuid
+from markupsafe import escape
+import config
 from database import (
-    init_db, insert_sample_data, get_all_projects, get_project_by_id,
+    get_project_by_id,
     add_project, update_project, delete_project,
-    get_auth_session, is_admin_user, reject_auth_session,
-    get_all_tags, add_tag, delete_tag, get_project_tags, set_project_tags, get_projects_by_tag
+    get_auth_session, create_auth_session, is_admin_user, reject_auth_session,
+    get_all_tags, add_tag, delete_tag, set_project_tags, get_projects_with_tags,
+    create_image_job, get_latest_image_jobs, get_project_cards,
+    get_project_cards_by_ids, search_projects, SNIPPET_MARKERS
 )
 from translations import get_user_language, get_translations, detect_language_by_location
-
-# Load environment variables
-load_dotenv()
+import page_cache
+import auth_events
+import assets
+import compression
+import fonts
+import critical_css
+import metrics
+import migrations
+import tag_index
+import storage
+import export
+import bulk
+from notifications import queue_access_request
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-this')  # Change this in production
@@ -19,14 +37,46 @@ app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-this')  # Chang
 # Get Telegram bot URL from environment
 TELEGRAM_BOT_URL = os.getenv('TELEGRAM_BOT_URL', 'https://t.me/your_bot_username')
 
+# Bearer token for scraping /metrics without an admin session (disabled if unset)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Longest time (seconds) /api/check_auth holds a request open waiting for approval
+AUTH_LONGPOLL_TIMEOUT = int(os.getenv('AUTH_LONGPOLL_TIMEOUT', 25))
+
+# Cards per page of the portfolio grid: the first page is rendered into
+# index.html, the rest is loaded from /api/projects while scrolling
+PROJECTS_PAGE_SIZE = 12
+MAX_PROJECTS_PAGE_SIZE = 48
+
+# Results returned by /api/search
+SEARCH_RESULTS = 20
+MAX_SEARCH_RESULTS = 50
+
 # Configuration
 UPLOAD_FOLDER = 'static/images'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Views whose uploads are images for the content-addressed storage
+app.config['UPLOAD_ENDPOINTS'] = {'admin_dashboard_post'}
+app.config['PROJECTS_PAGE_SIZE'] = PROJECTS_PAGE_SIZE
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-# Ensure upload directory exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Stream uploads to content-named files in UPLOAD_FOLDER (created if missing)
+storage.init_app(app)
+
+# Request, query and template timings for /metrics; registered first so the
+# request duration includes the other after_request hooks
+metrics.init_app(app)
+# Fingerprinted static URLs (asset_url in templates) with immutable caching
+assets.init_app(app)
+# Compress dynamic HTML/JSON (static files are precompressed, see compression.py)
+compression.init_app(app)
+# Self-hosted fonts: inline @font-face and preload hints
+fonts.init_app(app)
+# Inline above-the-fold CSS (critical_css() in templates)
+critical_css.init_app(app)
+# Static copies of the public pages for the front-end server (EXPORT_DIR)
+export.init_app(app)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -47,46 +97,200 @@ def login_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
-# Initialize database on app start
-init_db()
-insert_sample_data()
+def conditional_response(body, mimetype, etag, last_modified, cache_control, encoded=None):
+    """Build a response with validators and answer conditional requests with 304
+
+    Bodies above compression.MIN_SIZE are sent compressed when the client
+    accepts it, using the precompressed copies in `encoded` when given. Each
+    encoding gets its own ETag so conditional requests match the right variant.
+    """
+    compressible = len(body) >= compression.MIN_SIZE
+    encoding = compression.negotiate(request) if compressible else None
+    if encoding:
+        body = encoded[encoding] if encoded and encoding in encoded else compression.compress(body, encoding)
+        etag = f'{etag}-{encoding}'
+
+    response = app.response_class(body, mimetype=mimetype)
+    if encoding:
+        response.content_encoding = encoding
+    if compressible:
+        response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+def encode_cursor(key):
+    """Opaque pagination cursor for a (created_at, id) key from get_project_cards"""
+    if not key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """(created_at, id) from a pagination cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        created_at, project_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(created_at, str) or not isinstance(project_id, int):
+        return None
+    return created_at, project_id
+
+def card_json(project, translations):
+    """The fields of a portfolio card, with the translated title and description"""
+    translated = translations['projects'].get(project['id'], {})
+    return {
+        'id': project['id'],
+        'title': translated.get('title', project['title']),
+        'description': translated.get('description', project['description']),
+        'preview_image': project['preview_image'],
+        'preview_width': project['preview_width'],
+        'preview_height': project['preview_height'],
+        'preview_variants': project['preview_variants'],
+        'tags': project['tags'],
+    }
+
+def filter_args(selection, mode):
+    """Query string arguments for a tag selection"""
+    args = {}
+    if selection:
+        args['tags'] = ','.join(str(tag_id) for tag_id in selection)
+        if mode != 'and':
+            args['mode'] = mode
+    return args
+
+def grid_page(selection, mode, limit, after, version):
+    """One page of portfolio cards under a tag selection and the key of the next page"""
+    if not selection:
+        return get_project_cards(limit, after)
+    index = tag_index.get_index(version)
+    project_ids, next_key = index.page(index.match(selection, mode), limit, after)
+    return get_project_cards_by_ids(project_ids), next_key
+
+def tag_filters(index, selection, mode):
+    """Tag bar entries: each tag with its count and the URL that toggles it"""
+    # With 'and' a count is what the grid shows after adding the tag; with
+    # 'or' every tag adds its own projects, so the count is the tag's total
+    counts = index.facets(index.match(selection, mode) if mode == 'and' else index.all)
+    filters = []
+    for tag in index.tags:
+        selected = tag['id'] in selection
+        toggled = tuple(sorted(set(selection) ^ {tag['id']}))
+        filters.append({
+            'id': tag['id'],
+            'name': tag['name'],
+            'count': counts[tag['id']],
+            'selected': selected,
+            'url': url_for('index', **filter_args(toggled, mode)),
+        })
+    return filters
+
+def highlight_snippet(snippet):
+    """Escape a search snippet and wrap its matches in <mark>"""
+    start, end = SNIPPET_MARKERS
+    return str(escape(snippet)).replace(start, '<mark>').replace(end, '</mark>')
+
+# Migrations run once from gunicorn's on_starting hook (or python migrations.py);
+# here it is only a version check, so worker restarts stay cheap
+migrations.ensure_schema()
 
 @app.route('/')
 def index():
     # Always use Russian language
     lang = 'ru'
-    translations = get_translations(lang)
-
-    # Get tag filter if specified
-    tag_id = request.args.get('tag', type=int)
-    if tag_id:
-        projects = get_projects_by_tag(tag_id)
-    else:
-        projects = get_all_projects()
-
-    # Add tags to each project
-    for project in projects:
-        project['tags'] = get_project_tags(project['id'])
 
-    tags = get_all_tags()
-
-    return render_template('index.html', projects=projects, t=translations, lang=lang, tags=tags, selected_tag=tag_id)
+    # Tag filter: ?tags=1,2 with all (default) or, with ?mode=or, any of the tags
+    selection, mode = tag_index.parse_selection(request.args)
+    # Later pages are normally loaded by script.js; ?cursor= serves them without JS
+    after = decode_cursor(request.args.get('cursor'))
+
+    # The page only changes on admin mutations, so serve it from cache when possible
+    cache_key = ('index', selection, mode, after)
+    version = page_cache.current_version()
+    page = page_cache.get_page(cache_key, version)
+    if page is None:
+        translations = get_translations(lang)
+        projects, next_key = grid_page(selection, mode, PROJECTS_PAGE_SIZE, after, version)
+        index = tag_index.get_index(version)
+        next_cursor = encode_cursor(next_key)
+
+        body = render_template(
+            'index.html', projects=projects, t=translations, lang=lang,
+            tags=tag_filters(index, selection, mode), total_projects=len(index.keys),
+            selected_tags=selection, mode=mode,
+            mode_urls={other: url_for('index', **filter_args(selection, other)) for other in tag_index.MODES},
+            next_cursor=next_cursor,
+            more_url=url_for('index', cursor=next_cursor, **filter_args(selection, mode)) if next_cursor else None
+        )
+        page = page_cache.store_page(cache_key, body, version)
+
+    # Browsers revalidate on every visit, which costs a 304 when nothing changed
+    return conditional_response(
+        page['body'], 'text/html', page['etag'], page['last_modified'], 'public, no-cache', page['encoded']
+    )
+
+@app.route('/api/projects')
+def api_projects():
+    """One page of portfolio cards for infinite scroll: ?cursor=<next_cursor>&tags=<ids>&mode=<and|or>&limit=<n>"""
+    selection, mode = tag_index.parse_selection(request.args)
+    cursor = request.args.get('cursor')
+    after = decode_cursor(cursor)
+    if cursor and after is None:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    limit = min(max(request.args.get('limit', PROJECTS_PAGE_SIZE, type=int), 1), MAX_PROJECTS_PAGE_SIZE)
+
+    cache_key = ('projects', selection, mode, after, limit)
+    version = page_cache.current_version()
+    page = page_cache.get_page(cache_key, version)
+    if page is None:
+        translations = get_translations('ru')
+        projects, next_key = grid_page(selection, mode, limit, after, version)
+        body = app.json.dumps({
+            'projects': [card_json(project, translations) for project in projects],
+            'next_cursor': encode_cursor(next_key),
+        })
+        page = page_cache.store_page(cache_key, body, version)
+
+    return conditional_response(
+        page['body'], 'application/json', page['etag'], page['last_modified'], 'public, no-cache', page['encoded']
+    )
+
+@app.route('/api/search')
+def api_search():
+    """Full-text search over projects: ?q=<words>&limit=<n>, best match first
+
+    Every word has to match, as a word prefix. Snippets are HTML with the
+    matches in <mark>.
+    """
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', SEARCH_RESULTS, type=int), 1), MAX_SEARCH_RESULTS)
+
+    # Not page-cached: queries are too varied and would push the pages out
+    translations = get_translations('ru')
+    results = []
+    for project in search_projects(query, limit):
+        result = card_json(project, translations)
+        result['snippet'] = highlight_snippet(project['snippet'])
+        results.append(result)
+    return jsonify({'query': query, 'results': results})
 
 @app.route('/project/<int:project_id>')
 def get_project(project_id):
     project = get_project_by_id(project_id)
     if project:
-        return jsonify(project)
+        body = app.json.dumps(project)
+        # The modal re-opens the same project often; let the browser reuse it briefly
+        return conditional_response(
+            body, 'application/json', page_cache.make_etag(body),
+            page_cache.parse_timestamp(project['updated_at']), 'public, max-age=60'
+        )
     return jsonify({'error': 'Project not found'}), 404
 
 @app.route('/api/request_access', methods=['POST'])
 def request_access():
-    """Create auth session and notify admin"""
-    import uuid
-    import json
-    from urllib import request as urlreq
-    from urllib.error import URLError
-
+    """Create auth session and queue the admin notification"""
     # Generate session token
     token = str(uuid.uuid4())
 
@@ -95,57 +299,61 @@ def request_access():
     ip_address = request.remote_addr
 
     # Create session in database
-    from database import create_auth_session
     create_auth_session(token, 0, f"Web User from {ip_address}")
 
-    # Send request to Telegram bot admin
-    BOT_TOKEN = "8486309645:AAHGj8DkNk6vGRY2p8yFGTA9_xWxfv8g8Xs"
-    ADMIN_ID = 180587749
-
-    try:
-        message = (
-            f"🔐 Запрос доступа к админ-панели\n\n"
-            f"🌐 IP: {ip_address}\n"
-            f"🖥️ User Agent: {user_agent[:50]}...\n"
-            f"🔑 Session: {token[:8]}...\n\n"
-            f"Разрешить доступ?"
-        )
-
-        payload = {
-            "chat_id": ADMIN_ID,
-            "text": message,
-            "reply_markup": {
-                "inline_keyboard": [[
-                    {"text": "✅ Разрешить", "callback_data": f"approve_{token}"},
-                    {"text": "❌ Отклонить", "callback_data": f"deny_{token}"}
-                ]]
-            }
-        }
-
-        req = urlreq.Request(
-            f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
-            data=json.dumps(payload).encode('utf-8'),
-            headers={'Content-Type': 'application/json'}
-        )
-
-        urlreq.urlopen(req, timeout=5)
-    except (URLError, Exception) as e:
-        print(f"Failed to send Telegram message: {e}")
+    # The Telegram message is sent by the outbox dispatcher, not on this request
+    queue_access_request(token, ip_address, user_agent)
 
     return jsonify({'token': token, 'status': 'pending'})
 
 @app.route('/api/check_auth/<token>')
 def check_auth_status(token):
-    """API endpoint to check authentication status"""
+    """API endpoint to check authentication status
+
+    With ?wait=<seconds> this is a long poll: a pending session is held open
+    until the bot approves or rejects it, or until the wait runs out.
+    """
+    # Take the generation before reading the status so no change is missed
+    generation = auth_events.current_generation()
     auth_session = get_auth_session(token)
 
+    wait = min(request.args.get('wait', 0, type=int), AUTH_LONGPOLL_TIMEOUT)
+    deadline = time.monotonic() + wait
+    while auth_session and auth_session['status'] == 'pending':
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        new_generation = auth_events.wait_for_change(generation, remaining)
+        if new_generation == generation:
+            break
+        generation = new_generation
+        auth_session = get_auth_session(token)
+
     if not auth_session:
-        return jsonify({'status': 'invalid'})
+        response = jsonify({'status': 'invalid'})
+    else:
+        response = jsonify({
+            'status': auth_session['status'],
+            'username': auth_session['username']
+        })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics of all workers, for admins or `Authorization: Bearer <METRICS_TOKEN>`"""
+    authorization = request.headers.get('Authorization', '')
+    # compare_digest() rejects str with non-ASCII characters; bytes work for any header
+    authorized = bool(METRICS_TOKEN) and hmac.compare_digest(authorization.encode(), f'Bearer {METRICS_TOKEN}'.encode())
+    if not authorized and 'admin_token' in session:
+        auth_session = get_auth_session(session['admin_token'])
+        authorized = bool(auth_session and auth_session['status'] == 'approved')
+    if not authorized:
+        return 'Forbidden', 403
 
-    return jsonify({
-        'status': auth_session['status'],
-        'username': auth_session['username']
-    })
+    response = app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 # Admin routes
 @app.route('/admin/login', methods=['GET', 'POST'])
@@ -201,13 +409,10 @@ def admin_logout():
 @app.route('/admin')
 @login_required
 def admin_dashboard():
-    projects = get_all_projects()
-    # Add tags to each project
-    for project in projects:
-        project['tags'] = get_project_tags(project['id'])
-
+    projects = get_projects_with_tags()
     tags = get_all_tags()
-    return render_template('admin_dashboard.html', projects=projects, tags=tags)
+    image_jobs = get_latest_image_jobs()
+    return render_template('admin_dashboard.html', projects=projects, tags=tags, image_jobs=image_jobs)
 
 @app.route('/admin', methods=['POST'])
 @login_required
@@ -228,16 +433,15 @@ def admin_dashboard_post():
 
         # Handle file upload
         preview_image = None
+        upload_path = None
         if 'preview_image' in request.files:
             file = request.files['preview_image']
             if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Add timestamp to avoid conflicts
-                import time
-                filename = f"{int(time.time())}_{filename}"
+                # Named by content hash, so the file can be cached as immutable
+                filename = storage.store_upload(file, app.config['UPLOAD_FOLDER'])
                 file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
                 preview_image = f"/static/images/{filename}"
+                upload_path = file_path
 
         if project_id:  # Update existing project
             # Keep existing image if no new one uploaded
@@ -245,17 +449,23 @@ def admin_dashboard_post():
                 existing_project = get_project_by_id(int(project_id))
                 preview_image = existing_project['preview_image'] if existing_project else '/static/images/placeholder.jpg'
 
-            update_project(int(project_id), title, description, full_description, preview_image, live_url)
-            set_project_tags(int(project_id), tag_ids)
+            saved_project_id = int(project_id)
+            update_project(saved_project_id, title, description, full_description, preview_image, live_url)
+            set_project_tags(saved_project_id, tag_ids)
             flash('Проект успешно обновлен!', 'success')
         else:  # Add new project
             if not preview_image:
                 preview_image = '/static/images/placeholder.jpg'
 
-            new_project_id = add_project(title, description, full_description, preview_image, live_url)
-            set_project_tags(new_project_id, tag_ids)
+            saved_project_id = add_project(title, description, full_description, preview_image, live_url)
+            set_project_tags(saved_project_id, tag_ids)
             flash('Проект успешно добавлен!', 'success')
 
+        # The original is served until the image worker swaps in the AVIF/WebP variants
+        if upload_path:
+            create_image_job(saved_project_id, upload_path, preview_image)
+            flash('Изображение поставлено в очередь на обработку', 'success')
+
     elif action == 'delete':
         # Delete project
         project_id = request.form.get('project_id')
@@ -280,6 +490,58 @@ def admin_dashboard_post():
             delete_tag(int(tag_id))
             flash('Тег успешно удален!', 'success')
 
+    # Make this worker pick up the new content version right away; the others
+    # notice it within page_cache.VERSION_CHECK_INTERVAL
+    page_cache.invalidate()
+    # Regenerate the affected static pages in the background
+    export.schedule()
+
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/projects/export')
+@login_required
+def admin_export_projects():
+    """Download all projects: ?format=jsonl (default) or csv"""
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in bulk.FORMATS:
+        return jsonify({'error': 'Unknown format'}), 400
+    # Streamed: rows are read from the database as the client downloads them
+    response = app.response_class(stream_with_context(bulk.export_projects(fmt)), mimetype=bulk.MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=projects.{fmt}'
+    return response
+
+@app.route('/admin/projects/import', methods=['POST'])
+@login_required
+def admin_import_projects():
+    """Import projects from an uploaded JSONL or CSV file
+
+    Answers with the import report as JSON when the client prefers it (API
+    use), otherwise flashes a summary and returns to the dashboard.
+    """
+    wants_json = request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'application/json'
+    file = request.files.get('file')
+    if not file or not file.filename:
+        if wants_json:
+            return jsonify({'error': 'No file'}), 400
+        flash('Выберите файл для импорта', 'error')
+        return redirect(url_for('admin_dashboard'))
+
+    fmt = request.form.get('format')
+    if fmt not in bulk.FORMATS:
+        fmt = bulk.detect_format(file.filename)
+    # Werkzeug has spooled the upload to a temporary file; it is read line by line
+    report = bulk.import_projects(io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline=''), fmt)
+
+    if report['imported']:
+        page_cache.invalidate()
+        export.schedule()
+
+    if wants_json:
+        return jsonify(report)
+    flash(f"Импортировано проектов: {report['imported']}, ошибок: {report['failed']}",
+          'error' if report['failed'] else 'success')
+    for error in report['errors'][:5]:
+        flash(f"Строка {error['line']}: {error['error']}", 'error')
     return redirect(url_for('admin_dashboard'))
 
 if __name__ == '__main__':
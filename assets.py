@@ -0,0 +1,153 @@
+"""
+Content-hashed static asset URLs
+
+At startup every file under static/ is hashed and gets a fingerprinted name
+(css/style.css -> css/style.1a2b3c4d5e6f.css). Templates link assets through
+`asset_url()`, and the static view serves fingerprinted paths with a one-year
+immutable Cache-Control, so a changed file simply gets a new URL.
+
+Stylesheets are rewritten to reference the fingerprinted fonts and images
+they use; the rewritten CSS is what gets hashed and served.
+
+Text files are served precompressed when the client accepts it: stylesheets
+from memory, other files from the .gz/.br copies written by compression.py.
+
+Uploaded previews are named by their content hash by storage.py, so
+they and their resized variants are immutable without a manifest entry.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+import compression
+
+HASH_LENGTH = 12
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Uploads stored by storage.py and their variants from images.py
+HASHED_UPLOAD = re.compile(r'^images/[0-9a-f]{16}(-\d+w)?\.[a-z0-9]+$')
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+_manifest = {}   # original path -> fingerprinted path
+_originals = {}  # fingerprinted path -> original path
+_bodies = {}     # original path -> rewritten content (stylesheets)
+_encoded = {}    # original path -> {encoding: compressed rewritten content}, filled on first request
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+def _fingerprint(path, digest):
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.{digest}{extension}"
+
+def _rewrite_css(path, css):
+    """Point relative url() references of a stylesheet at fingerprinted files"""
+    base = os.path.dirname(path)
+
+    def replace(match):
+        quote, target = match.groups()
+        if target.startswith(('/', 'data:', 'http:', 'https:', '#')):
+            return match.group(0)
+        resolved = os.path.normpath(os.path.join(base, target)).replace(os.sep, '/')
+        if resolved not in _manifest:
+            return match.group(0)
+        relative = os.path.relpath(_manifest[resolved], base).replace(os.sep, '/')
+        return f"url({quote}{relative}{quote})"
+
+    return CSS_URL.sub(replace, css)
+
+def build_manifest(static_folder):
+    """Hash every file under `static_folder` and rebuild the manifest"""
+    _manifest.clear()
+    _originals.clear()
+    _bodies.clear()
+    _encoded.clear()
+
+    stylesheets = []
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            path = os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+            if HASHED_UPLOAD.match(path) or path.endswith(tuple(compression.EXTENSIONS.values())):
+                continue
+            if path.endswith('.css'):
+                stylesheets.append(path)
+                continue
+            with open(os.path.join(static_folder, path), 'rb') as f:
+                _manifest[path] = _fingerprint(path, _digest(f.read()))
+
+    # Stylesheets last, so the files they reference already have their hashes
+    for path in stylesheets:
+        with open(os.path.join(static_folder, path), encoding='utf-8') as f:
+            body = _rewrite_css(path, f.read()).encode('utf-8')
+        _bodies[path] = body
+        _manifest[path] = _fingerprint(path, _digest(body))
+
+    _originals.update({fingerprinted: path for path, fingerprinted in _manifest.items()})
+    return dict(_manifest)
+
+def _encoded_body(path, encoding):
+    # Compressing at the best level takes tens of milliseconds per stylesheet;
+    # doing it on first use keeps it out of every worker's startup
+    encoded = _encoded.setdefault(path, {})
+    if encoding not in encoded:
+        encoded[encoding] = compression.compress(_bodies[path], encoding, best=True)
+    return encoded[encoding]
+
+def manifest_digest():
+    """Digest of the manifest; changes whenever a static file does"""
+    return _digest(repr(sorted(_manifest.items())).encode('utf-8'))
+
+def asset_url(filename):
+    """URL of a static file; fingerprinted unless the app runs in debug mode"""
+    if not current_app.debug:
+        filename = _manifest.get(filename, filename)
+    return url_for('static', filename=filename)
+
+def serve_static(filename):
+    """Static view: fingerprinted and content-named files are cached forever"""
+    original = _originals.get(filename)
+    path = original or filename
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if original in _bodies:
+        encoding = compression.negotiate(request)
+        body = _encoded_body(original, encoding) if encoding else _bodies[original]
+        etag = f"{_manifest[original]}-{encoding}" if encoding else _manifest[original]
+        response = current_app.response_class(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.content_encoding = encoding
+        response = response.make_conditional(request)
+    else:
+        file_path = safe_join(current_app.static_folder, path)
+        available = [
+            encoding for encoding in compression.ENCODINGS
+            if file_path and compression.precompressed_path(file_path, encoding)
+        ]
+        encoding = compression.negotiate(request, available)
+        if encoding:
+            response = send_from_directory(
+                current_app.static_folder, path + compression.EXTENSIONS[encoding], mimetype=mimetype
+            )
+            response.content_encoding = encoding
+        else:
+            response = current_app.send_static_file(path)
+        if available:
+            response.vary.add('Accept-Encoding')
+
+    if original or HASHED_UPLOAD.match(filename):
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+def init_app(app):
+    """Build the manifest and install the template helper and static view"""
+    build_manifest(app.static_folder)
+    app.add_template_global(asset_url)
+    app.view_functions['static'] = serve_static
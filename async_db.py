@@ -0,0 +1,44 @@
+"""
+Async data access for the bot's asyncio event loop
+
+database.py is synchronous; calling it from a python-telegram-bot handler
+would stall every other update until SQLite finishes. These wrappers run the
+calls in executor threads instead. Writes go through a single thread so the
+bot never competes with itself for the SQLite write lock.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import auth_events
+import database
+
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+
+async def run_read(func, *args, **kwargs):
+    """Run a read-only database call in the default executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+async def run_write(func, *args, **kwargs):
+    """Run a database write in the dedicated writer thread"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_write_executor, partial(func, *args, **kwargs))
+
+def _decide_auth_session(decide, session_token):
+    updated = decide(session_token)
+    if updated:
+        # Wake the web workers long-polling this session
+        auth_events.notify()
+    return updated
+
+async def approve_auth_session(session_token):
+    """Approve a pending auth session and notify waiting web requests"""
+    return await run_write(_decide_auth_session, database.approve_auth_session, session_token)
+
+async def reject_auth_session(session_token):
+    """Reject a pending auth session and notify waiting web requests"""
+    return await run_write(_decide_auth_session, database.reject_auth_session, session_token)
+
+async def get_auth_session(session_token):
+    """Get auth session by token"""
+    return await run_read(database.get_auth_session, session_token)
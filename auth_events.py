@@ -0,0 +1,64 @@
+"""
+Cross-process notifications for auth session status changes
+
+bot.py approves and rejects sessions in a separate process. Instead of every
+waiting request polling SQLite, the bot touches a small signal file and each
+web worker runs one watcher thread that stats it and wakes the requests
+waiting on /api/check_auth.
+"""
+import os
+import threading
+import time
+from database import DATABASE_PATH
+
+SIGNAL_PATH = os.getenv('AUTH_SIGNAL_PATH', f'{DATABASE_PATH}-auth-signal')
+
+# How often (seconds) the watcher thread checks the signal file
+WATCH_INTERVAL = float(os.getenv('AUTH_SIGNAL_INTERVAL', 0.25))
+
+_condition = threading.Condition()
+_generation = 0
+_watcher_pid = None
+
+def notify():
+    """Signal waiters in every process that an auth session changed"""
+    with open(SIGNAL_PATH, 'a'):
+        pass
+    os.utime(SIGNAL_PATH, None)
+
+def _signal_stamp():
+    try:
+        return os.stat(SIGNAL_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _watch(stamp):
+    global _generation
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        current = _signal_stamp()
+        if current != stamp:
+            stamp = current
+            with _condition:
+                _generation += 1
+                _condition.notify_all()
+
+def _ensure_watcher():
+    global _watcher_pid
+    # Threads do not survive fork(), so every worker process starts its own
+    with _condition:
+        if _watcher_pid != os.getpid():
+            _watcher_pid = os.getpid()
+            threading.Thread(target=_watch, args=(_signal_stamp(),), daemon=True).start()
+
+def current_generation():
+    """Get the number of changes seen by this process so far"""
+    _ensure_watcher()
+    return _generation
+
+def wait_for_change(generation, timeout):
+    """Wait until a change newer than `generation` is seen; returns the latest generation"""
+    _ensure_watcher()
+    with _condition:
+        _condition.wait_for(lambda: _generation != generation, timeout)
+        return _generation
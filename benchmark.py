@@ -0,0 +1,497 @@
+"""
+Load benchmark for the public, auth and admin endpoints
+
+Seeds a scratch SQLite database with realistic volumes, starts gunicorn with
+gunicorn.conf.py (bound to a free local port, logs redirected), drives each
+scenario with concurrent keep-alive clients and reports latency percentiles
+and throughput. Telegram is replaced by a local stub, so the run is offline.
+It also profiles `import app` in fresh interpreters, which is what every
+gunicorn worker pays on (re)start.
+
+    python benchmark.py                                  # run and print results
+    python benchmark.py --save bench-baseline.json       # keep as baseline
+    python benchmark.py --compare bench-baseline.json    # exit 1 on regressions
+    python benchmark.py --search-scaling 1000,10000,100000   # search latency by table size
+
+The load generator runs in this process, so keep --concurrency moderate and
+compare runs made on the same machine.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+ADMIN_TOKEN = 'bench-admin-token'
+SCENARIOS = ('index', 'index_tag', 'project', 'search', 'check_auth', 'admin')
+# Lower is better for latencies, higher for throughput
+METRICS = (('p50_ms', 1), ('p95_ms', 1), ('p99_ms', 1), ('rps', -1))
+STARTUP_METRICS = (('import_ms', 1),)
+
+# Seeding
+
+SYLLABLES = ('ба', 'ве', 'ги', 'до', 'жу', 'за', 'ки', 'ло', 'му', 'не', 'по', 'ру', 'са', 'те', 'фу', 'ха', 'це', 'чи', 'ша', 'ю')
+# Searchable words added to each generated project
+WORDS_PER_PROJECT = 6
+
+def vocabulary(size, rng):
+    """`size` distinct made-up words of four syllables
+
+    With as many words as projects, every word is in about WORDS_PER_PROJECT
+    projects whatever the table size, so searches for them have the same
+    selectivity at every scale.
+    """
+    combinations = len(SYLLABLES) ** 4
+    if size > combinations:
+        raise ValueError(f"at most {combinations} words")
+    return [
+        ''.join(SYLLABLES[index // len(SYLLABLES) ** power % len(SYLLABLES)] for power in range(4))
+        for index in rng.sample(range(combinations), size)
+    ]
+
+def seed_database(path, projects, tags, tags_per_project, sessions, rng):
+    """Create a database at `path` filled with generated content"""
+    import database
+    import migrations
+
+    database.DATABASE_PATH = path
+    migrations.migrate(sample_data=False)
+    conn = database.get_db_connection()
+    words = vocabulary(projects, rng)
+
+    # Created in order so that tag ids are 1..tags
+    conn.executemany(
+        'INSERT INTO tags (name) VALUES (?)',
+        [(f'Тег {i}',) for i in range(tags)]
+    )
+    conn.commit()
+
+    # Through the bulk import path, one minute apart, oldest first (ids 1..projects)
+    now = datetime.now(timezone.utc)
+    database.write_projects(
+        {
+            'id': None, 'title': f'Проект {i}', 'description': f'Краткое описание проекта {i}. ' * 3,
+            'full_description': f'Полное описание проекта {i}. ' * 40 + ' '.join(rng.sample(words, WORDS_PER_PROJECT)),
+            'preview_image': f'/static/images/project{i % 3 + 1}-preview.jpg',
+            'preview_width': None, 'preview_height': None, 'preview_variants': None,
+            'live_url': f'https://example.com/{i}',
+            'created_at': (now - timedelta(minutes=projects - i)).strftime('%Y-%m-%d %H:%M:%S'),
+            'tags': [f'Тег {tag}' for tag in rng.sample(range(tags), min(tags_per_project, tags))],
+        }
+        for i in range(projects)
+    )
+
+    # Mostly expired sessions, as left behind between purges, plus live ones
+    statuses = ['pending'] * 6 + ['approved'] * 3 + ['rejected']
+    conn.executemany(
+        '''INSERT INTO auth_sessions (session_token, telegram_user_id, username, status, created_at, expires_at)
+           VALUES (?, ?, ?, ?, datetime('now', ?), datetime('now', ?))''',
+        [
+            (
+                f'bench-session-{i}', 1000 + i % 50, f'user{i % 50}', rng.choice(statuses),
+                f'-{rng.randint(0, 7 * 24 * 60)} minutes',
+                f'+{rng.randint(1, 60)} minutes' if i % 4 == 0 else f'-{rng.randint(1, 7 * 24 * 60)} minutes',
+            )
+            for i in range(sessions)
+        ]
+    )
+    conn.execute(
+        '''INSERT INTO auth_sessions (session_token, telegram_user_id, username, status, expires_at, approved_at)
+           VALUES (?, 1, 'bench', 'approved', datetime('now', '+1 day'), CURRENT_TIMESTAMP)''',
+        (ADMIN_TOKEN,)
+    )
+    conn.commit()
+
+    live_tokens = [f'bench-session-{i}' for i in range(0, sessions, 4)]
+    database.close_db_connections()
+    return live_tokens, words
+
+def _python_search(database, query):
+    # What searching looked like without the index: every row through Python
+    query = query.lower()
+    return [
+        project for project in database.get_all_projects()
+        if query in f"{project['title']} {project['description']} {project['full_description']}".lower()
+    ]
+
+def search_scaling(sizes, queries, rng):
+    """search_projects() latency at each table size, against a Python scan"""
+    import database
+    import migrations
+
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix='portfolio-search-') as workdir:
+            database.DATABASE_PATH = os.path.join(workdir, 'search.db')
+            migrations.migrate(sample_data=False)
+            conn = database.get_db_connection()
+            words = vocabulary(size, rng)
+            conn.executemany(
+                'INSERT INTO projects (title, description, full_description) VALUES (?, ?, ?)',
+                (
+                    (f'Проект {i}', f'Краткое описание проекта {i}.',
+                     f'Полное описание проекта {i}. ' * 10 + ' '.join(rng.sample(words, WORDS_PER_PROJECT)))
+                    for i in range(size)
+                )
+            )
+            conn.commit()
+
+            latencies, matches = [], 0
+            for query in (rng.choice(words) for _ in range(queries)):
+                started = time.perf_counter()
+                matches += len(database.search_projects(query))
+                latencies.append(time.perf_counter() - started)
+
+            # The scan is slow on big tables; a few runs show the trend
+            scans = []
+            for query in (rng.choice(words) for _ in range(5)):
+                started = time.perf_counter()
+                _python_search(database, query)
+                scans.append(time.perf_counter() - started)
+            database.close_db_connections()
+
+        latencies.sort()
+        scans.sort()
+        results[str(size)] = {
+            'fts_p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'fts_p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'scan_p50_ms': round(percentile(scans, 0.50) * 1000, 1),
+            'avg_matches': round(matches / queries, 1),
+        }
+        print(f"  {size} projects: {results[str(size)]['fts_p50_ms']} ms")
+    return results
+
+# Startup
+
+IMPORT_SCRIPT = 'import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)'
+
+def _parse_importtime(output):
+    """(module, self ms) for every line of `python -X importtime` output"""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|', 2)
+        modules.append((name.strip(), int(self_us) / 1000))
+    return modules
+
+def profile_import(workdir, db_path, runs):
+    """Median wall time of `import app` and its slowest modules, over `runs` fresh interpreters"""
+    env = dict(
+        os.environ,
+        DATABASE_PATH=db_path,
+        METRICS_DIR=os.path.join(workdir, 'metrics'),
+        TELEGRAM_BOT_TOKEN='0:benchmark',
+        SECRET_KEY='benchmark',
+    )
+    samples = []
+    for _ in range(runs):
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', IMPORT_SCRIPT],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        )
+        samples.append((float(process.stdout.strip().splitlines()[-1]), process.stderr))
+    samples.sort()
+    elapsed, profile = samples[len(samples) // 2]
+    slowest = sorted(_parse_importtime(profile), key=lambda module: -module[1])[:10]
+    return {
+        'import_ms': round(elapsed * 1000, 1),
+        'slowest': [[name, round(ms, 1)] for name, ms in slowest],
+    }
+
+# Servers
+
+class _TelegramStub(BaseHTTPRequestHandler):
+    """Accepts every Bot API call, so nothing is sent to Telegram"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = b'{"ok": true, "result": {}}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+def start_telegram_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _TelegramStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_gunicorn(port, workdir, db_path, telegram_url, workers=None):
+    """Run the app under gunicorn.conf.py; only the bind address and log files are overridden"""
+    env = dict(
+        os.environ,
+        DATABASE_PATH=db_path,
+        METRICS_DIR=os.path.join(workdir, 'metrics'),
+        TELEGRAM_API_URL=telegram_url,
+        TELEGRAM_BOT_TOKEN='0:benchmark',
+        ADMIN_TELEGRAM_ID='1',
+        SECRET_KEY='benchmark',
+    )
+    command = [
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+        '--bind', f'127.0.0.1:{port}',
+        '--access-logfile', os.devnull,
+        '--error-logfile', os.path.join(workdir, 'gunicorn-error.log'),
+    ]
+    if workers:
+        command += ['--workers', str(workers)]
+    process = subprocess.Popen(command + ['app:app'], cwd=ROOT, env=env)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited, see {os.path.join(workdir, 'gunicorn-error.log')}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start within 30 seconds")
+
+def admin_cookie(port):
+    """Log in through the auto-login URL and return the session cookie"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', f'/admin/login?token={ADMIN_TOKEN}&auto=1')
+    response = conn.getresponse()
+    response.read()
+    return response.getheader('Set-Cookie').split(';', 1)[0]
+
+# Load generation
+
+def scenario_paths(projects, tags, live_tokens, words):
+    """Path generator per scenario"""
+    return {
+        'index': lambda rng: '/',
+        'index_tag': lambda rng: f'/?tag={rng.randint(1, tags)}',
+        'project': lambda rng: f'/project/{rng.randint(1, projects)}',
+        'search': lambda rng: f'/api/search?q={quote(rng.choice(words))}',
+        'check_auth': lambda rng: f'/api/check_auth/{rng.choice(live_tokens)}',
+        'admin': lambda rng: '/admin',
+    }
+
+def drive(port, make_path, headers, concurrency, duration, seed):
+    """Send requests from `concurrency` threads for `duration` seconds"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(index):
+        rng = random.Random(seed + index)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        failed = 0
+        while time.monotonic() < deadline:
+            path = make_path(rng)
+            started = time.perf_counter()
+            # A second attempt on a fresh connection: gunicorn closes idle
+            # keep-alive connections, which is not a failed request
+            for attempt in range(2):
+                try:
+                    conn.request('GET', path, headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                    break
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                    started = time.perf_counter()
+                    ok = False
+            if ok:
+                local.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started
+
+def percentile(values, fraction):
+    index = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[index]
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'requests': 0, 'errors': errors, 'rps': 0.0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+# Reporting
+
+def print_results(results):
+    print(f"{'scenario':<12} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, result in results.items():
+        print(
+            f"{name:<12} {result['requests']:>9} {result['errors']:>7} {result['rps']:>9} "
+            f"{result['p50_ms']!s:>9} {result['p95_ms']!s:>9} {result['p99_ms']!s:>9}"
+        )
+
+def print_search_scaling(results):
+    print(f"{'projects':>9} {'fts p50 ms':>11} {'fts p95 ms':>11} {'matches':>8} {'scan p50 ms':>12}")
+    for size, result in results.items():
+        print(
+            f"{size:>9} {result['fts_p50_ms']:>11} {result['fts_p95_ms']:>11} "
+            f"{result['avg_matches']:>8} {result['scan_p50_ms']:>12}"
+        )
+
+def print_startup(startup):
+    print(f"\nimport app: {startup['import_ms']} ms (median), slowest modules by self time:")
+    for name, ms in startup['slowest']:
+        print(f"  {name:<40} {ms:>8} ms")
+
+def compare(results, baseline, threshold, metrics=METRICS):
+    """Print the change against `baseline`; returns the number of regressions"""
+    regressions = 0
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        changes = []
+        for metric, direction in metrics:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change * direction > threshold
+            regressions += worse
+            changes.append(f"{metric} {old} -> {new} ({change:+.1%}){' REGRESSION' if worse else ''}")
+        print(f"  {name:<12} " + ', '.join(changes))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--projects', type=int, default=3000)
+    parser.add_argument('--tags', type=int, default=300)
+    parser.add_argument('--tags-per-project', type=int, default=8)
+    parser.add_argument('--sessions', type=int, default=100000)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated subset of ' + ', '.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help='seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds per scenario before measuring')
+    parser.add_argument('--workers', type=int, help='override the gunicorn.conf.py worker count')
+    parser.add_argument('--accept-encoding', default='gzip, br')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--import-runs', type=int, default=5, help='fresh interpreters for the import profile (0 to skip)')
+    parser.add_argument('--search-scaling', metavar='SIZES', help='only measure search latency at these comma-separated project counts')
+    parser.add_argument('--search-queries', type=int, default=200, help='queries per size for --search-scaling')
+    parser.add_argument('--save', metavar='FILE', help='write the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative change that counts as a regression')
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    rng = random.Random(args.seed)
+    if args.search_scaling:
+        sizes = [int(size) for size in args.search_scaling.split(',') if size]
+        results = search_scaling(sizes, args.search_queries, rng)
+        print()
+        print_search_scaling(results)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump({'settings': vars(args), 'search_scaling': results}, f, indent=2)
+            print(f"\nSaved to {args.save}")
+        return
+
+    with tempfile.TemporaryDirectory(prefix='portfolio-bench-') as workdir:
+        db_path = os.path.join(workdir, 'bench.db')
+        started = time.perf_counter()
+        live_tokens, words = seed_database(db_path, args.projects, args.tags, args.tags_per_project, args.sessions, rng)
+        print(f"Seeded {args.projects} projects, {args.tags} tags, {args.sessions} auth sessions "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        startup = profile_import(workdir, db_path, args.import_runs) if args.import_runs else None
+
+        stub = start_telegram_stub()
+        port = free_port()
+        server = start_gunicorn(port, workdir, db_path, f'http://127.0.0.1:{stub.server_port}', args.workers)
+        try:
+            cookie = admin_cookie(port)
+            paths = scenario_paths(args.projects, args.tags, live_tokens, words)
+            results = {}
+            for name in scenarios:
+                headers = {'Accept-Encoding': args.accept_encoding}
+                if name == 'admin':
+                    headers['Cookie'] = cookie
+                drive(port, paths[name], headers, args.concurrency, args.warmup, args.seed)
+                results[name] = summarize(*drive(port, paths[name], headers, args.concurrency, args.duration, args.seed))
+                print(f"  {name}: {results[name]['rps']} req/s")
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            stub.shutdown()
+
+    print()
+    print_results(results)
+    if startup:
+        print_startup(startup)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'settings': vars(args),
+                'results': results,
+                'startup': startup,
+            }, f, indent=2, ensure_ascii=False)
+        print(f"\nSaved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nChange against baseline (regression threshold {args.threshold:.0%}):")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if startup and baseline.get('startup'):
+            regressions += compare({'startup': startup}, {'startup': baseline['startup']}, args.threshold, STARTUP_METRICS)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
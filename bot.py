@@ -1,7 +1,10 @@
 import logging
+import sys
 from telegram import Update
 from telegram.ext import Application, CallbackQueryHandler, ContextTypes
-from database import approve_auth_session, reject_auth_session
+import async_db
+from notifications import BOT_TOKEN, ADMIN_ID as ADMIN_TELEGRAM_ID, require_settings, start_dispatcher_thread
+from maintenance import start_maintenance_thread
 
 # Configure logging
 logging.basicConfig(
@@ -10,10 +13,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Bot configuration
-BOT_TOKEN = "8486309645:AAHGj8DkNk6vGRY2p8yFGTA9_xWxfv8g8Xs"
-ADMIN_TELEGRAM_ID = 180587749
-
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle button callbacks for admin approval/rejection"""
     query = update.callback_query
@@ -31,8 +30,13 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if data.startswith("approve_"):
         session_token = data.replace("approve_", "")
 
-        # Approve the session in database
-        approve_auth_session(session_token)
+        # Approve the session in database without blocking other updates
+        if not await async_db.approve_auth_session(session_token):
+            await query.edit_message_text(
+                f"⚠️ Запрос уже обработан или истек\n"
+                f"🔑 Токен: {session_token[:8]}..."
+            )
+            return
 
         # Update message
         await query.edit_message_text(
@@ -46,8 +50,13 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     elif data.startswith("deny_"):
         session_token = data.replace("deny_", "")
 
-        # Reject the session in database
-        reject_auth_session(session_token)
+        # Reject the session in database without blocking other updates
+        if not await async_db.reject_auth_session(session_token):
+            await query.edit_message_text(
+                f"⚠️ Запрос уже обработан или истек\n"
+                f"🔑 Токен: {session_token[:8]}..."
+            )
+            return
 
         # Update message
         await query.edit_message_text(
@@ -60,28 +69,37 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 def run_bot():
     """Run the Telegram bot"""
-    if not BOT_TOKEN:
-        logger.error("BOT_TOKEN is not set")
-        return
-
-    if not ADMIN_TELEGRAM_ID:
-        logger.error("ADMIN_TELEGRAM_ID is not set")
-        return
+    try:
+        require_settings()
+    except RuntimeError as e:
+        sys.exit(str(e))
 
-    # Create application
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Create application; updates are processed concurrently so a burst of
+    # access requests is not handled one callback at a time
+    application = Application.builder().token(BOT_TOKEN).concurrent_updates(True).build()
 
     # Add only callback handler - no commands needed
     application.add_handler(CallbackQueryHandler(button_callback))
 
+    # Deliver access request messages queued by the web app
+    start_dispatcher_thread()
+
+    # Purge expired auth sessions and old notifications in the background
+    start_maintenance_thread()
+
     # Run the bot
     logger.info("Starting bot (callback handler only)...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
-    # Initialize database first
-    from database import init_db
-    init_db()
+    try:
+        require_settings()
+    except RuntimeError as e:
+        sys.exit(str(e))
+
+    # Make sure the database schema is up to date
+    from migrations import ensure_schema
+    ensure_schema()
 
     print("🤖 Telegram Bot для авторизации (только inline кнопки)")
     print(f"✅ BOT_TOKEN: установлен")
@@ -0,0 +1,201 @@
+"""
+Bulk import and export of projects as JSON Lines or CSV
+
+Both directions stream, so memory stays flat for any number of projects: an
+export reads the projects in batches, and an import validates rows as it
+reads them and writes them with executemany in a single transaction (see
+database.write_projects). Rows that fail validation are skipped and reported
+with their line number; the others are imported.
+
+A row with an `id` replaces that project, rows without one are added. Tags
+are given by name and created when missing; in CSV they are separated by
+TAG_SEPARATOR and preview_variants is JSON text.
+
+    python bulk.py export projects.jsonl
+    python bulk.py export --format csv > projects.csv
+    python bulk.py import projects.csv
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime
+from database import iter_projects, write_projects
+
+FIELDS = (
+    'id', 'title', 'description', 'full_description', 'preview_image', 'preview_width',
+    'preview_height', 'preview_variants', 'live_url', 'created_at', 'tags',
+)
+FORMATS = ('jsonl', 'csv')
+MIMETYPES = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
+
+TAG_SEPARATOR = ';'
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+DEFAULT_PREVIEW = '/static/images/placeholder.jpg'
+
+# Errors listed in a report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+def detect_format(filename, default='jsonl'):
+    """Format from a file name extension (.jsonl/.ndjson/.csv)"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    return default
+
+def _record(project):
+    record = {field: project[field] for field in FIELDS if field != 'tags'}
+    record['tags'] = [tag['name'] for tag in project['tags']]
+    return record
+
+def export_projects(fmt='jsonl'):
+    """Yield all projects as lines of text in `fmt`"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, FIELDS)
+        writer.writeheader()
+        for project in iter_projects():
+            record = _record(project)
+            record['tags'] = TAG_SEPARATOR.join(record['tags'])
+            record['preview_variants'] = json.dumps(record['preview_variants'], ensure_ascii=False) if record['preview_variants'] else ''
+            writer.writerow(record)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    else:
+        for project in iter_projects():
+            yield json.dumps(_record(project), ensure_ascii=False) + '\n'
+
+def _read(lines, fmt):
+    """Yield (line number, row dict or the ValueError that row raised)"""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_number, ValueError(f'invalid JSON: {error}')
+            continue
+        yield line_number, row if isinstance(row, dict) else ValueError('expected a JSON object')
+
+def _text(row, field, default=None):
+    value = row.get(field)
+    if value is None or value == '':
+        return default
+    if not isinstance(value, str):
+        raise ValueError(f'{field}: expected a string')
+    return value
+
+def _integer(row, field):
+    value = row.get(field)
+    if value is None or value == '':
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise ValueError(f'{field}: expected a positive integer')
+    return value
+
+def parse_record(row):
+    """Validate a row read from a file and turn it into a record for database.write_projects"""
+    title = _text(row, 'title', '').strip()
+    if not title:
+        raise ValueError('title is required')
+
+    created_at = _text(row, 'created_at')
+    if created_at is not None:
+        try:
+            parsed = datetime.strptime(created_at, TIMESTAMP_FORMAT)
+        except ValueError:
+            parsed = None
+        # strptime also accepts e.g. "2024-1-1 1:1:1", which would sort wrong as
+        # text: only the zero-padded form is stored
+        if parsed is None or parsed.strftime(TIMESTAMP_FORMAT) != created_at:
+            raise ValueError(f'created_at: expected {TIMESTAMP_FORMAT}')
+
+    variants = row.get('preview_variants') or None
+    if isinstance(variants, str):
+        try:
+            variants = json.loads(variants)
+        except ValueError:
+            raise ValueError('preview_variants: invalid JSON') from None
+    if variants is not None and not (isinstance(variants, list) and all(isinstance(v, dict) for v in variants)):
+        raise ValueError('preview_variants: expected a list of objects')
+
+    tags = row.get('tags') or []
+    if isinstance(tags, str):
+        tags = tags.split(TAG_SEPARATOR)
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise ValueError('tags: expected a list of names')
+
+    return {
+        'id': _integer(row, 'id'),
+        'title': title,
+        'description': _text(row, 'description', ''),
+        'full_description': _text(row, 'full_description', ''),
+        'preview_image': _text(row, 'preview_image', DEFAULT_PREVIEW),
+        'preview_width': _integer(row, 'preview_width'),
+        'preview_height': _integer(row, 'preview_height'),
+        'preview_variants': variants,
+        'live_url': _text(row, 'live_url'),
+        'created_at': created_at,
+        # Stripped, without empty names and duplicates, in the given order
+        'tags': list(dict.fromkeys(tag.strip() for tag in tags if tag.strip())),
+    }
+
+def import_projects(lines, fmt='jsonl'):
+    """Import projects from an iterable of text lines in `fmt`
+
+    Returns a report: the number of projects imported and of rows that
+    failed, and the first MAX_REPORTED_ERRORS errors with their line numbers.
+    """
+    report = {'imported': 0, 'failed': 0, 'errors': []}
+
+    def records():
+        for line_number, row in _read(lines, fmt):
+            try:
+                if isinstance(row, ValueError):
+                    raise row
+                yield parse_record(row)
+            except ValueError as error:
+                report['failed'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append({'line': line_number, 'error': str(error)})
+
+    report['imported'] = write_projects(records())
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('file', nargs='?', help='file to read or write (default: stdin/stdout)')
+    parser.add_argument('--format', choices=FORMATS, help='default: from the file extension, else jsonl')
+    args = parser.parse_args()
+
+    from migrations import ensure_schema
+    ensure_schema()
+
+    fmt = args.format or detect_format(args.file)
+    if args.command == 'export':
+        output = open(args.file, 'w', encoding='utf-8', newline='') if args.file else sys.stdout
+        with output:
+            output.writelines(export_projects(fmt))
+    else:
+        # utf-8-sig: spreadsheet programs often save CSV with a BOM
+        source = open(args.file, encoding='utf-8-sig', newline='') if args.file else sys.stdin
+        with source:
+            report = import_projects(source, fmt)
+        print(f"Imported {report['imported']} project(s), {report['failed']} row(s) failed")
+        for error in report['errors']:
+            print(f"  line {error['line']}: {error['error']}")
+        if report['failed'] > len(report['errors']):
+            print(f"  ... and {report['failed'] - len(report['errors'])} more")
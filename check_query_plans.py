@@ -0,0 +1,183 @@
+"""
+Query plan regression check for database.py
+
+Runs every database function against a scratch database, captures the SQL it
+issues, asks SQLite for the plan of each statement and fails when a query
+has to scan a whole table or sort its result in a temporary B-tree. Sorting
+a small, index-bounded result is sometimes the right plan; those cases are
+listed in ALLOWED_TEMP_SORTS with the reason.
+
+    python check_query_plans.py          # exit code 1 on regressions
+    python check_query_plans.py -v       # print every plan
+
+The same checks run per function in the test suite (tests/test_query_plans.py).
+"""
+import inspect
+import os
+import sys
+import tempfile
+import database
+import migrations
+
+# Call label -> why a temp B-tree sort is acceptable there
+ALLOWED_TEMP_SORTS = {
+    'get_project_cards': 'sorts the tags of one page of projects',
+    'get_project_cards(after)': 'sorts the tags of one page of projects',
+    'get_project_cards(tag_id)': 'sorts the tags of one page of projects',
+    'search_projects': 'sorts the tags of one page of results',
+    'get_project_cards_by_ids': 'sorts the tags of one page of projects',
+    'iter_projects': 'sorts the tags of one batch of projects',
+}
+
+# Functions that do not issue application queries of their own
+NOT_QUERIES = {
+    'get_db_connection', 'close_db_connections',
+    'get_storage_settings', 'retry_on_busy', 'set_query_observer', 'search_match_expression',
+}
+
+def seed():
+    """Fill the scratch database with enough rows to exercise every query"""
+    migrations.migrate(sample_data=False)
+    tag_ids = [database.add_tag(f'Tag {i}') for i in range(20)]
+    project_ids = [
+        database.add_project(f'Project {i}', 'Description', 'Full description', '/static/images/x.jpg', 'https://example.com')
+        for i in range(50)
+    ]
+    for i, project_id in enumerate(project_ids):
+        database.set_project_tags(project_id, tag_ids[i % 17:i % 17 + 3])
+    database.create_auth_session('plan-check-token', 0, 'plan-check')
+    database.add_admin_user(1, 'plan-check')
+    database.enqueue_notification({'chat_id': 1, 'text': 'plan check'})
+    return project_ids, tag_ids
+
+def query_calls(project_ids, tag_ids):
+    """(label, function name, callable) for every query in database.py"""
+    project_id, other_project_id = project_ids[0], project_ids[1]
+    tag_id = tag_ids[0]
+    return [
+        ('get_content_version', 'get_content_version', database.get_content_version),
+        ('get_all_projects', 'get_all_projects', database.get_all_projects),
+        ('get_project_by_id', 'get_project_by_id', lambda: database.get_project_by_id(project_id)),
+        ('get_projects_with_tags', 'get_projects_with_tags', database.get_projects_with_tags),
+        ('get_project_cards', 'get_project_cards', lambda: database.get_project_cards(12)),
+        ('get_project_cards(after)', 'get_project_cards', lambda: database.get_project_cards(12, ('2100-01-01 00:00:00', 10))),
+        ('get_project_cards(tag_id)', 'get_project_cards', lambda: database.get_project_cards(12, ('2100-01-01 00:00:00', 10), tag_id)),
+        ('search_projects', 'search_projects', lambda: database.search_projects('proj descr')),
+        ('get_project_cards_by_ids', 'get_project_cards_by_ids', lambda: database.get_project_cards_by_ids(project_ids[:12])),
+        ('get_project_keys', 'get_project_keys', database.get_project_keys),
+        ('get_project_tag_pairs', 'get_project_tag_pairs', database.get_project_tag_pairs),
+        ('get_project_versions', 'get_project_versions', database.get_project_versions),
+        ('iter_projects', 'iter_projects', lambda: list(database.iter_projects())),
+        ('write_projects', 'write_projects', lambda: database.write_projects([
+            {'id': project_ids[0], 'title': 'Проект', 'description': '', 'full_description': '',
+             'preview_image': None, 'preview_width': None, 'preview_height': None, 'preview_variants': None,
+             'live_url': None, 'created_at': None, 'tags': ['Импорт']},
+            {'id': None, 'title': 'Новый', 'description': '', 'full_description': '',
+             'preview_image': None, 'preview_width': None, 'preview_height': None, 'preview_variants': None,
+             'live_url': None, 'created_at': None, 'tags': ['Импорт']},
+        ])),
+        ('register_stored_file', 'register_stored_file', lambda: database.register_stored_file('0123456789abcdef.jpg', 10, lambda: None)),
+        ('get_unreferenced_files', 'get_unreferenced_files', lambda: database.get_unreferenced_files(0)),
+        ('get_stored_file_names', 'get_stored_file_names', database.get_stored_file_names),
+        ('delete_stored_file', 'delete_stored_file', lambda: database.delete_stored_file('0123456789abcdef.jpg', 0, lambda name: None)),
+        ('get_all_tags', 'get_all_tags', database.get_all_tags),
+        ('add_project', 'add_project', lambda: database.add_project('T', 'D', 'F', None, None)),
+        ('update_project', 'update_project', lambda: database.update_project(project_id, 'T', 'D', 'F', None, None)),
+        ('set_project_preview', 'set_project_preview', lambda: database.set_project_preview(project_id, '/static/images/y.webp', 960, 540, [])),
+        ('set_project_tags', 'set_project_tags', lambda: database.set_project_tags(project_id, tag_ids[:2])),
+        ('add_tag', 'add_tag', lambda: database.add_tag('Plan check tag')),
+        ('create_auth_session', 'create_auth_session', lambda: database.create_auth_session('plan-check-2', 0, 'x')),
+        ('get_auth_session', 'get_auth_session', lambda: database.get_auth_session('plan-check-token')),
+        ('approve_auth_session', 'approve_auth_session', lambda: database.approve_auth_session('plan-check-token')),
+        ('reject_auth_session', 'reject_auth_session', lambda: database.reject_auth_session('plan-check-2')),
+        ('purge_expired_auth_sessions', 'purge_expired_auth_sessions', lambda: database.purge_expired_auth_sessions(100)),
+        ('is_admin_user', 'is_admin_user', lambda: database.is_admin_user(1)),
+        ('add_admin_user', 'add_admin_user', lambda: database.add_admin_user(2, 'x')),
+        ('enqueue_notification', 'enqueue_notification', lambda: database.enqueue_notification({'chat_id': 1})),
+        ('claim_notifications', 'claim_notifications', lambda: database.claim_notifications(10)),
+        ('mark_notification_sent', 'mark_notification_sent', lambda: database.mark_notification_sent(1)),
+        ('mark_notification_failed', 'mark_notification_failed', lambda: database.mark_notification_failed(2, 'error', 5)),
+        ('purge_finished_notifications', 'purge_finished_notifications', lambda: database.purge_finished_notifications(100)),
+        ('create_image_job', 'create_image_job', lambda: database.create_image_job(project_id, 'static/images/x.jpg', '/static/images/x.jpg')),
+        ('claim_image_jobs', 'claim_image_jobs', lambda: database.claim_image_jobs(4)),
+        ('finish_image_job', 'finish_image_job', lambda: database.finish_image_job(1, {'url': '/static/images/x.webp', 'width': 1, 'height': 1, 'variants': []})),
+        ('fail_image_job', 'fail_image_job', lambda: database.fail_image_job(1, 'error')),
+        ('get_latest_image_jobs', 'get_latest_image_jobs', database.get_latest_image_jobs),
+        ('delete_project', 'delete_project', lambda: database.delete_project(other_project_id)),
+        ('delete_tag', 'delete_tag', lambda: database.delete_tag(tag_ids[-1])),
+    ]
+
+def capture_statements(func):
+    """Run `func` and return the SQL statements it executed"""
+    conn = database.get_db_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        func()
+    finally:
+        conn.set_trace_callback(None)
+    return [s for s in statements if s.lstrip().split(None, 1)[0].upper() in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')]
+
+def plan_problems(plan):
+    """Full table scans and temp B-tree sorts in an EXPLAIN QUERY PLAN result"""
+    problems = []
+    for detail in plan:
+        if detail.startswith('SCAN ') and 'USING' not in detail and 'VIRTUAL TABLE' not in detail \
+                and detail != 'SCAN CONSTANT ROW':
+            problems.append(('scan', detail))
+        elif 'USE TEMP B-TREE' in detail:
+            problems.append(('sort', detail))
+    return problems
+
+def uncovered_functions(calls):
+    """Public functions of database.py that are neither in `calls` nor in NOT_QUERIES"""
+    covered = {name for _, name, _ in calls}
+    functions = {
+        name for name, obj in inspect.getmembers(database, inspect.isfunction)
+        if obj.__module__ == database.__name__ and not name.startswith('_') and name not in NOT_QUERIES
+    }
+    return sorted(functions - covered)
+
+def check_call(label, func):
+    """Run one query call; returns (statement, plan, problems) for each statement it executed"""
+    conn = database.get_db_connection()
+    results = []
+    for statement in capture_statements(func):
+        plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {statement}')]
+        problems = plan_problems(plan)
+        if label in ALLOWED_TEMP_SORTS:
+            problems = [p for p in problems if p[0] != 'sort']
+        results.append((statement, plan, problems))
+    return results
+
+def check(verbose=False):
+    """Check every query; returns the number of failing statements"""
+    project_ids, tag_ids = seed()
+    calls = query_calls(project_ids, tag_ids)
+
+    # Every function that touches the database has to be registered above
+    failures = 0
+    for name in uncovered_functions(calls):
+        print(f"FAIL {name}: not covered by check_query_plans.query_calls")
+        failures += 1
+
+    for label, _, func in calls:
+        for statement, plan, problems in check_call(label, func):
+            if problems or verbose:
+                status = 'FAIL' if problems else 'ok'
+                print(f"{status} {label}: {' '.join(statement.split())}")
+                for detail in plan:
+                    print(f"    {detail}")
+            failures += bool(problems)
+    return failures
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_PATH = os.path.join(tmp, 'plan-check.db')
+        failures = check(verbose='-v' in sys.argv)
+        database.close_db_connections()
+
+    if failures:
+        print(f"{failures} query plan problem(s) found")
+        sys.exit(1)
+    print("All query plans use indexes")
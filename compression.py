@@ -0,0 +1,118 @@
+"""
+Response compression
+
+Static text files are precompressed to .gz/.br by a build step and served by
+the static view (see assets.py) according to Accept-Encoding. Dynamic HTML
+and JSON above MIN_SIZE are compressed per response; the page cache stores
+its bodies already compressed.
+
+    python compression.py   # write .gz/.br next to the files under static/
+"""
+import gzip
+import os
+import sys
+import config
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional: without it only gzip is offered
+    brotli = None
+
+# Smaller bodies gain nothing from compression
+MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml',
+}
+
+# Files the build step precompresses (fonts and images are compressed already)
+PRECOMPRESS_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.html', '.txt')
+
+# Preferred first when the client accepts both equally
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+def compress(data, encoding, best=False):
+    """Compress `data` (str or bytes); `best` trades a lot of CPU for size (build step only)"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else 5)
+    # mtime=0 keeps the output reproducible
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+def compress_all(data, best=True):
+    """Compressed copies of `data` for every supported encoding"""
+    return {encoding: compress(data, encoding, best) for encoding in ENCODINGS}
+
+def negotiate(request, available=ENCODINGS):
+    """Pick the encoding the client prefers among `available`, or None"""
+    best, best_quality = None, 0
+    for encoding in available:
+        quality = request.accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def precompressed_path(file_path, encoding):
+    """Path of an up-to-date precompressed copy of `file_path`, or None"""
+    path = file_path + EXTENSIONS[encoding]
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(file_path):
+            return path
+    except OSError:
+        pass
+    return None
+
+def precompress_static(static_folder):
+    """Write .gz/.br copies of the text files under `static_folder`"""
+    written = 0
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if not name.endswith(PRECOMPRESS_EXTENSIONS):
+                continue
+            file_path = os.path.join(root, name)
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            if len(data) < MIN_SIZE:
+                continue
+            for encoding, compressed in compress_all(data).items():
+                if len(compressed) < len(data):
+                    with open(file_path + EXTENSIONS[encoding], 'wb') as f:
+                        f.write(compressed)
+                    written += 1
+    return written
+
+def compress_response(response):
+    """after_request hook: compress dynamic responses that were not compressed yet"""
+    from flask import request
+
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request)
+    if encoding:
+        response.set_data(compress(data, encoding))
+        response.content_encoding = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+def init_app(app):
+    """Compress dynamic responses of `app`"""
+    app.after_request(compress_response)
+
+if __name__ == '__main__':
+    if brotli is None:
+        print("Brotli is not installed, writing gzip only (pip install Brotli)")
+    static_folder = sys.argv[1] if len(sys.argv) > 1 else 'static'
+    print(f"Wrote {precompress_static(static_folder)} precompressed file(s)")
@@ -0,0 +1,12 @@
+"""
+Settings from the environment
+
+Importing this module loads .env (from the project directory) into
+os.environ, without overriding variables that are already set. Modules that
+read settings when they are imported import it first, directly or through
+database.py, so every entry point (app.py, bot.py, the module CLIs,
+gunicorn.conf.py) sees the values from .env whatever it imports first.
+"""
+from dotenv import load_dotenv
+
+load_dotenv()
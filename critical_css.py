@@ -0,0 +1,186 @@
+"""
+Critical CSS for server-rendered pages
+
+The part of a template above the `{# critical-css: end #}` marker is scanned
+for the tags, classes and ids it renders (plus the classes script.js adds),
+and only the style.css rules that can match them are kept. Templates inline
+the result and load the full stylesheet asynchronously.
+
+Extraction runs once per process and template, like the asset fingerprints
+(see assets.py): the sources only change with a deploy, which restarts the
+workers, so a render does no file I/O. In debug mode the result is also
+keyed on the modification times of the template, style.css and script.js,
+so edits show up without a restart.
+
+    python critical_css.py [template]   # show the extracted CSS and its size
+"""
+import os
+import re
+import sys
+import threading
+from markupsafe import Markup
+
+FOLD_MARKER = '{# critical-css: end #}'
+STYLESHEET = 'css/style.css'
+SCRIPT = 'js/script.js'
+
+# Interaction states are never needed for the first paint
+INTERACTIVE = re.compile(r':(hover|focus|focus-within|focus-visible|active)\b')
+PSEUDO = re.compile(r'::?[\w-]+(\([^)]*\))?')
+ATTRIBUTE = re.compile(r'\[[^\]]*\]')
+JS_CLASSES = re.compile(r'''classList\.(?:add|toggle)\(\s*['"]([\w-]+)['"]''')
+KEYFRAMES_NAME = re.compile(r'@(?:-webkit-)?keyframes\s+([\w-]+)')
+
+_cache = {}
+_lock = threading.Lock()
+
+def _strip_comments(css):
+    return re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+
+def _block_end(css, start):
+    """Index just past the '}' matching the '{' at `start`"""
+    depth = 0
+    for i in range(start, len(css)):
+        if css[i] == '{':
+            depth += 1
+        elif css[i] == '}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return len(css)
+
+def parse_css(css):
+    """Split a stylesheet into (prelude, body) pairs; nested blocks keep their raw body"""
+    items = []
+    position = 0
+    while True:
+        brace = css.find('{', position)
+        if brace == -1:
+            return items
+        prelude = css[position:brace].strip()
+        # Statements without a block, like @import or @charset
+        while ';' in prelude and prelude.startswith('@'):
+            prelude = prelude.split(';', 1)[1].strip()
+        end = _block_end(css, brace)
+        items.append((prelude, css[brace + 1:end - 1].strip()))
+        position = end
+
+def page_selectors(html, script=''):
+    """Tags, classes and ids used by a chunk of template source (and added by script.js)"""
+    tags = {tag.lower() for tag in re.findall(r'<([a-zA-Z][a-zA-Z0-9]*)', html)} | {'html', 'body'}
+    classes = set()
+    for value in re.findall(r'class="([^"]*)"', html):
+        classes.update(re.findall(r'[\w-]+', value))
+    classes.update(JS_CLASSES.findall(script))
+    ids = set(re.findall(r'id="([\w-]+)"', html))
+    return tags, classes, ids
+
+def _split_selectors(selectors):
+    parts, depth, current = [], 0, ''
+    for char in selectors:
+        depth += char == '('
+        depth -= char == ')'
+        if char == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += char
+    parts.append(current.strip())
+    return [part for part in parts if part]
+
+def selector_matches(selector, tags, classes, ids):
+    """Whether every tag, class and id in `selector` is used by the page"""
+    if INTERACTIVE.search(selector):
+        return False
+    bare = ATTRIBUTE.sub('', PSEUDO.sub('', selector))
+    if not bare.strip():
+        # Only pseudo selectors, e.g. :root
+        return True
+    if not set(re.findall(r'\.([\w-]+)', bare)) <= classes:
+        return False
+    if not set(re.findall(r'#([\w-]+)', bare)) <= ids:
+        return False
+    elements = re.findall(r'(?:^|[\s>+~])([a-zA-Z][\w-]*)', bare)
+    return all(element.lower() in tags for element in elements)
+
+def _filter(items, used):
+    output = []
+    for prelude, body in items:
+        if prelude.startswith(('@media', '@supports')):
+            inner = _filter(parse_css(body), used)
+            if inner:
+                output.append(f"{prelude}{{{''.join(inner)}}}")
+        elif prelude.startswith('@font-face'):
+            output.append(f"{prelude}{{{body}}}")
+        elif prelude.startswith('@'):
+            # @keyframes are added afterwards if a kept rule uses them
+            continue
+        else:
+            selectors = [s for s in _split_selectors(prelude) if selector_matches(s, *used)]
+            if selectors:
+                output.append(f"{','.join(selectors)}{{{body}}}")
+    return output
+
+def _minify(css):
+    css = re.sub(r'\s+', ' ', css)
+    # Spaces before ':' are kept: in selectors they are descendant combinators
+    css = re.sub(r':\s+', ':', css)
+    return re.sub(r'\s*([{};,>])\s*', r'\1', css).replace(';}', '}')
+
+def extract(template_source, css, script=''):
+    """Critical CSS of a template: the rules its above-the-fold markup can match"""
+    above_fold = template_source.split(FOLD_MARKER, 1)[0]
+    css = _strip_comments(css)
+    items = parse_css(css)
+    rules = _filter(items, page_selectors(above_fold, script))
+    critical = ''.join(rules)
+
+    # Keyframes referenced by the kept rules
+    for prelude, body in items:
+        match = KEYFRAMES_NAME.match(prelude)
+        if match and re.search(rf'\banimation(-name)?\s*:[^;}}]*\b{re.escape(match.group(1))}\b', critical):
+            critical += f"{prelude}{{{body}}}"
+    return _minify(critical)
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def critical_css(template_name):
+    """Critical CSS for `template_name`, cached per template (and file versions in debug mode)"""
+    from flask import current_app
+
+    key = template_name
+    if current_app.debug:
+        key = (template_name,) + tuple(_mtime(path) for path in (
+            os.path.join(current_app.root_path, current_app.template_folder, template_name),
+            os.path.join(current_app.static_folder, STYLESHEET),
+            os.path.join(current_app.static_folder, SCRIPT),
+        ))
+
+    result = _cache.get(key)
+    if result is None:
+        template_source = current_app.jinja_env.loader.get_source(current_app.jinja_env, template_name)[0]
+        css = _read(os.path.join(current_app.static_folder, STYLESHEET))
+        script = _read(os.path.join(current_app.static_folder, SCRIPT))
+        result = Markup(extract(template_source, css, script))
+        with _lock:
+            _cache[key] = result
+    return result
+
+def init_app(app):
+    """Make critical_css() available to templates"""
+    app.add_template_global(critical_css)
+
+if __name__ == '__main__':
+    template_name = sys.argv[1] if len(sys.argv) > 1 else 'index.html'
+    css = _read(os.path.join('static', STYLESHEET))
+    result = extract(_read(os.path.join('templates', template_name)), css, _read(os.path.join('static', SCRIPT)))
+    print(result)
+    print(f"\n{template_name}: {len(result)} of {len(css)} bytes of {STYLESHEET} are critical", file=sys.stderr)
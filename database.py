@@ -1,130 +1,283 @@
 import sqlite3
+import json
 import os
+import random
+import re
+import sys
+import threading
+import time
+import weakref
 from datetime import datetime
+from functools import wraps
+from itertools import islice
+import config
+
+# Overridable so that benchmarks and checks can run against a scratch database
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'portfolio.db')
+
+# Storage profiles, selected with SQLITE_PROFILE. Each setting can also be
+# overridden individually (SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS,
+# SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE, SQLITE_TEMP_STORE), which makes it
+# easy to benchmark one change at a time.
+STORAGE_PROFILES = {
+    # SQLite defaults: rollback journal, readers block the writer
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+    },
+    # WAL lets the web workers keep reading while the bot process writes
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+    # No fsync at all; only meant for benchmarks and throwaway databases
+    'wal-nosync': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+}
+DEFAULT_STORAGE_PROFILE = 'wal'
+
+# Rejected sessions stay readable this long (seconds) so the waiting browser
+# still sees 'rejected', then expire and are purged with the rest
+REJECTED_SESSION_TTL = 600
+
+# Full-text search: words of a query that are used, and the characters that
+# surround matches in snippets (chosen so they cannot occur in escaped HTML)
+SEARCH_MAX_WORDS = 8
+SNIPPET_MARKERS = ('\x02', '\x03')
+
+# Connections are kept open per thread and reused across calls. Every
+# connection opened by this process is also tracked so that a worker can
+# close all of them on shutdown (see close_db_connections). The registry only
+# holds weak references: when a thread exits, its thread-local connection is
+# released and closed, so servers that start a thread per request (the
+# Werkzeug dev server) do not pile up connections and file descriptors.
+_local = threading.local()
+_connections = weakref.WeakKeyDictionary()
+_connections_lock = threading.Lock()
+_storage_settings = None
+
+# Called as observer(function, seconds, fetch) for every statement and every
+# fetch when set (see metrics.py); `function` is the query function, e.g. get_all_projects
+_query_observer = None
+
+def get_storage_settings():
+    """Resolve the storage profile and tuning knobs from environment variables"""
+    global _storage_settings
+    if _storage_settings is None:
+        profile = os.getenv('SQLITE_PROFILE', DEFAULT_STORAGE_PROFILE)
+        if profile not in STORAGE_PROFILES:
+            raise ValueError(f"Unknown SQLITE_PROFILE '{profile}', expected one of {', '.join(STORAGE_PROFILES)}")
+
+        settings = dict(STORAGE_PROFILES[profile], profile=profile)
+        settings['journal_mode'] = os.getenv('SQLITE_JOURNAL_MODE', settings['journal_mode']).upper()
+        settings['synchronous'] = os.getenv('SQLITE_SYNCHRONOUS', settings['synchronous']).upper()
+        settings['cache_size'] = int(os.getenv('SQLITE_CACHE_SIZE', settings['cache_size']))
+        settings['mmap_size'] = int(os.getenv('SQLITE_MMAP_SIZE', settings['mmap_size']))
+        settings['temp_store'] = os.getenv('SQLITE_TEMP_STORE', settings['temp_store']).upper()
+        for key in ('journal_mode', 'synchronous', 'temp_store'):
+            # These end up in PRAGMA statements, which cannot take parameters
+            if not settings[key].isalpha():
+                raise ValueError(f"Invalid value for SQLite {key}: {settings[key]!r}")
+
+        # Busy timeout (milliseconds) before SQLite gives up waiting for a lock,
+        # then how many times and how fast writes are retried after that
+        settings['busy_timeout'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+        settings['write_retries'] = int(os.getenv('SQLITE_WRITE_RETRIES', 5))
+        settings['retry_backoff'] = float(os.getenv('SQLITE_RETRY_BACKOFF', 0.05))
+        _storage_settings = settings
+    return _storage_settings
+
+def _is_busy_error(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+def retry_on_busy(func):
+    """Retry a write with exponential backoff while the database is locked"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        settings = get_storage_settings()
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if attempt >= settings['write_retries'] or not _is_busy_error(e):
+                    raise
+                delay = settings['retry_backoff'] * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay))
+                attempt += 1
+    return wrapper
+
+def set_query_observer(observer):
+    """Install (or with None remove) the query timing observer"""
+    global _query_observer
+    _query_observer = observer
+
+def _caller():
+    """Name of the query function that ran the current statement
+
+    The outermost public function of this module on the stack, so the
+    statements of a helper like _attach_tags count toward get_project_cards
+    or search_projects. Statements run from other modules (migrations) are
+    labelled with the function that ran them.
+    """
+    # Frame 0 is this function, 1 the cursor method, 2 the code that ran the
+    # query, unless that is one of the _Connection shortcuts below
+    frame = sys._getframe(2)
+    while frame.f_code in _FORWARDING_CODE:
+        frame = frame.f_back
+    name = frame.f_code.co_name
+    while frame is not None and frame.f_globals is _GLOBALS:
+        code = frame.f_code
+        if not code.co_name.startswith(('_', '<')) and code not in _FORWARDING_CODE:
+            name = code.co_name
+        frame = frame.f_back
+    return name
+
+class _Cursor(sqlite3.Cursor):
+    """Cursor that reports statement and fetch timings to the query observer"""
+
+    def execute(self, sql, parameters=()):
+        if _query_observer is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _query_observer(_caller(), time.perf_counter() - started, False)
+
+    def executemany(self, sql, seq_of_parameters):
+        if _query_observer is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _query_observer(_caller(), time.perf_counter() - started, False)
+
+    def fetchone(self):
+        if _query_observer is None:
+            return super().fetchone()
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _query_observer(_caller(), time.perf_counter() - started, True)
+
+    def fetchall(self):
+        if _query_observer is None:
+            return super().fetchall()
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _query_observer(_caller(), time.perf_counter() - started, True)
+
+class _Connection(sqlite3.Connection):
+    """Connection whose cursors (also those behind conn.execute) are instrumented"""
+
+    def cursor(self, factory=_Cursor):
+        return super().cursor(factory)
+
+    # The built-in shortcuts create a plain cursor, bypassing cursor() above
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+# Frames that only pass a call on: the shortcuts above and the retry_on_busy wrapper
+_FORWARDING_CODE = {
+    _Connection.execute.__code__, _Connection.executemany.__code__, retry_on_busy(lambda: None).__code__,
+}
+_GLOBALS = globals()
+
+def _connect():
+    """Open and configure a new database connection"""
+    # check_same_thread is disabled only so that close_db_connections can
+    # close connections owned by other threads; each connection is still
+    # used by a single thread at a time.
+    settings = get_storage_settings()
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        timeout=settings['busy_timeout'] / 1000,
+        check_same_thread=False,
+        factory=_Connection
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = {settings['cache_size']}")
+    conn.execute(f"PRAGMA mmap_size = {settings['mmap_size']}")
+    conn.execute(f"PRAGMA temp_store = {settings['temp_store']}")
+    return conn
 
-DATABASE_PATH = 'portfolio.db'
+def get_db_connection():
+    """Get the database connection for the current thread, opening it on first use"""
+    conn = getattr(_local, 'conn', None)
+
+    # A connection inherited from the parent process across fork() must not be reused
+    if conn is None or _local.pid != os.getpid():
+        conn = _connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        with _connections_lock:
+            _connections[conn] = _local.pid
+    elif conn.in_transaction:
+        # A previous call on this thread failed before committing; discard
+        # its partial writes instead of committing them with the next call
+        conn.rollback()
 
-def init_db():
-    """Initialize the database with required tables"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+    return conn
 
-    # Projects table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT NOT NULL,
-            full_description TEXT NOT NULL,
-            preview_image TEXT,
-            live_url TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+def close_db_connections():
+    """Close every connection opened by the current process"""
+    pid = os.getpid()
+    with _connections_lock:
+        connections = [conn for conn, owner in list(_connections.items()) if owner == pid]
+        _connections.clear()
 
-    # Auth sessions table for Telegram authentication
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS auth_sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_token TEXT UNIQUE NOT NULL,
-            telegram_user_id INTEGER,
-            username TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP,
-            approved_at TIMESTAMP
-        )
-    ''')
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
 
-    # Admin users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS admin_users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            telegram_user_id INTEGER UNIQUE NOT NULL,
-            username TEXT,
-            is_active BOOLEAN DEFAULT TRUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # Tags table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tags (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    _local.conn = None
 
-    # Project tags relationship table (many-to-many)
+def _bump_content_version(cursor):
+    """Mark public content as changed; runs inside the caller's transaction"""
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS project_tags (
-            project_id INTEGER NOT NULL,
-            tag_id INTEGER NOT NULL,
-            PRIMARY KEY (project_id, tag_id),
-            FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE,
-            FOREIGN KEY (tag_id) REFERENCES tags (id) ON DELETE CASCADE
-        )
+        UPDATE content_version
+        SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1
     ''')
 
-    conn.commit()
-    conn.close()
-
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_content_version():
+    """Get the current public content version"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT version, updated_at FROM content_version WHERE id = 1')
+    row = cursor.fetchone()
+    return dict(row) if row else {'version': 0, 'updated_at': None}
 
-def insert_sample_data():
-    """Insert sample projects if database is empty"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Check if projects exist
-    cursor.execute('SELECT COUNT(*) FROM projects')
-    count = cursor.fetchone()[0]
-
-    if count == 0:
-        sample_projects = [
-            {
-                'title': 'E-commerce Website',
-                'description': 'Современный интернет-магазин с адаптивным дизайном',
-                'full_description': 'Полнофункциональный интернет-магазин, разработанный с использованием Flask и современного frontend стека. Включает корзину покупок, систему оплаты, админ-панель для управления товарами.',
-                'preview_image': '/static/images/project1-preview.jpg',
-                'live_url': 'https://example-shop.com'
-            },
-            {
-                'title': 'Blog Platform',
-                'description': 'Платформа для блогинга с системой комментариев',
-                'full_description': 'Современная блог-платформа с редактором Markdown, системой тегов, комментариями и авторизацией пользователей. Адаптивный дизайн и SEO-оптимизация.',
-                'preview_image': '/static/images/project2-preview.jpg',
-                'live_url': 'https://example-blog.com'
-            },
-            {
-                'title': 'Portfolio Dashboard',
-                'description': 'Интерактивная админ-панель для управления контентом',
-                'full_description': 'Профессиональная админ-панель с графиками, аналитикой, управлением пользователями и контентом. Реализована с использованием Chart.js и современных UI компонентов.',
-                'preview_image': '/static/images/project3-preview.jpg',
-                'live_url': 'https://example-dashboard.com'
-            }
-        ]
-
-        for project in sample_projects:
-            cursor.execute('''
-                INSERT INTO projects (title, description, full_description, preview_image, live_url)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                project['title'],
-                project['description'],
-                project['full_description'],
-                project['preview_image'],
-                project['live_url']
-            ))
-
-    conn.commit()
-    conn.close()
+def _project_from_row(row):
+    """Convert a projects row to a dict, decoding the stored preview variants"""
+    project = dict(row)
+    if 'preview_variants' in project:
+        project['preview_variants'] = json.loads(project['preview_variants'] or '[]')
+    return project
 
 def get_all_projects():
     """Get all projects from database"""
@@ -132,8 +285,7 @@ def get_all_projects():
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM projects ORDER BY created_at DESC')
     projects = cursor.fetchall()
-    conn.close()
-    return [dict(project) for project in projects]
+    return [_project_from_row(project) for project in projects]
 
 def get_project_by_id(project_id):
     """Get project by ID"""
@@ -141,9 +293,9 @@ def get_project_by_id(project_id):
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM projects WHERE id = ?', (project_id,))
     project = cursor.fetchone()
-    conn.close()
-    return dict(project) if project else None
+    return _project_from_row(project) if project else None
 
+@retry_on_busy
 def add_project(title, description, full_description, preview_image, live_url):
     """Add new project"""
     conn = get_db_connection()
@@ -153,32 +305,58 @@ def add_project(title, description, full_description, preview_image, live_url):
         VALUES (?, ?, ?, ?, ?)
     ''', (title, description, full_description, preview_image, live_url))
     project_id = cursor.lastrowid
+    _bump_content_version(cursor)
     conn.commit()
-    conn.close()
     return project_id
 
+@retry_on_busy
 def update_project(project_id, title, description, full_description, preview_image, live_url):
-    """Update existing project"""
+    """Update existing project
+
+    A new preview_image drops the dimensions and variants of the old one in
+    the same write, so they are never served next to the new original.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
+    # The CASE expressions see the row before the update
     cursor.execute('''
         UPDATE projects
         SET title = ?, description = ?, full_description = ?,
+            preview_width = CASE WHEN preview_image IS ? THEN preview_width END,
+            preview_height = CASE WHEN preview_image IS ? THEN preview_height END,
+            preview_variants = CASE WHEN preview_image IS ? THEN preview_variants END,
             preview_image = ?, live_url = ?, updated_at = CURRENT_TIMESTAMP
         WHERE id = ?
-    ''', (title, description, full_description, preview_image, live_url, project_id))
+    ''', (title, description, full_description, preview_image, preview_image, preview_image,
+          preview_image, live_url, project_id))
+    _bump_content_version(cursor)
     conn.commit()
-    conn.close()
 
+@retry_on_busy
+def set_project_preview(project_id, preview_image, width=None, height=None, variants=None):
+    """Set project preview image and its responsive variants"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE projects
+        SET preview_image = ?, preview_width = ?, preview_height = ?,
+            preview_variants = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (preview_image, width, height, json.dumps(variants) if variants else None, project_id))
+    _bump_content_version(cursor)
+    conn.commit()
+
+@retry_on_busy
 def delete_project(project_id):
     """Delete project"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('DELETE FROM projects WHERE id = ?', (project_id,))
+    _bump_content_version(cursor)
     conn.commit()
-    conn.close()
 
 # Auth functions
+@retry_on_busy
 def create_auth_session(session_token, telegram_user_id, username):
     """Create new auth session"""
     conn = get_db_connection()
@@ -191,7 +369,6 @@ def create_auth_session(session_token, telegram_user_id, username):
     ''', (session_token, telegram_user_id, username))
 
     conn.commit()
-    conn.close()
 
 def get_auth_session(session_token):
     """Get auth session by token"""
@@ -202,32 +379,50 @@ def get_auth_session(session_token):
         WHERE session_token = ? AND expires_at > datetime('now')
     ''', (session_token,))
     session = cursor.fetchone()
-    conn.close()
     return dict(session) if session else None
 
+@retry_on_busy
 def approve_auth_session(session_token):
-    """Approve auth session"""
+    """Approve a pending auth session; returns False if it was already decided or expired"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('''
         UPDATE auth_sessions
         SET status = 'approved', approved_at = CURRENT_TIMESTAMP
-        WHERE session_token = ?
+        WHERE session_token = ? AND status = 'pending' AND expires_at > datetime('now')
     ''', (session_token,))
     conn.commit()
-    conn.close()
+    return cursor.rowcount > 0
 
+@retry_on_busy
 def reject_auth_session(session_token):
-    """Reject auth session"""
+    """Reject a pending auth session; returns False if it was already decided or expired"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('''
         UPDATE auth_sessions
-        SET status = 'rejected', approved_at = CURRENT_TIMESTAMP
-        WHERE session_token = ?
-    ''', (session_token,))
+        SET status = 'rejected', approved_at = CURRENT_TIMESTAMP,
+            expires_at = MIN(expires_at, datetime('now', ?))
+        WHERE session_token = ? AND status = 'pending' AND expires_at > datetime('now')
+    ''', (f'+{REJECTED_SESSION_TTL} seconds', session_token))
     conn.commit()
-    conn.close()
+    return cursor.rowcount > 0
+
+@retry_on_busy
+def purge_expired_auth_sessions(batch_size):
+    """Delete up to `batch_size` expired auth sessions; returns the number deleted"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        DELETE FROM auth_sessions
+        WHERE id IN (
+            SELECT id FROM auth_sessions
+            WHERE expires_at <= datetime('now')
+            LIMIT ?
+        )
+    ''', (batch_size,))
+    conn.commit()
+    return cursor.rowcount
 
 def is_admin_user(telegram_user_id):
     """Check if user is admin"""
@@ -238,9 +433,9 @@ def is_admin_user(telegram_user_id):
         WHERE telegram_user_id = ? AND is_active = 1
     ''', (telegram_user_id,))
     user = cursor.fetchone()
-    conn.close()
     return user is not None
 
+@retry_on_busy
 def add_admin_user(telegram_user_id, username):
     """Add admin user"""
     conn = get_db_connection()
@@ -250,7 +445,263 @@ def add_admin_user(telegram_user_id, username):
         VALUES (?, ?)
     ''', (telegram_user_id, username))
     conn.commit()
-    conn.close()
+
+# Notification outbox functions
+@retry_on_busy
+def enqueue_notification(payload):
+    """Queue a Telegram message payload for the dispatcher"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('INSERT INTO notification_outbox (payload) VALUES (?)', (json.dumps(payload),))
+    notification_id = cursor.lastrowid
+    conn.commit()
+    return notification_id
+
+@retry_on_busy
+def claim_notifications(limit, stale_after=300):
+    """Claim a batch of due notifications for sending
+
+    Rows left in 'sending' for longer than `stale_after` seconds belong to a
+    dispatcher that died mid-batch and are claimed again.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    # Take the write lock up front so two dispatchers never claim the same rows
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('''
+        UPDATE notification_outbox
+        SET status = 'pending'
+        WHERE status = 'sending' AND claimed_at <= datetime('now', ?)
+    ''', (f'-{int(stale_after)} seconds',))
+    cursor.execute('''
+        SELECT * FROM notification_outbox
+        WHERE status = 'pending' AND next_attempt_at <= datetime('now')
+        ORDER BY next_attempt_at
+        LIMIT ?
+    ''', (limit,))
+    notifications = [dict(row) for row in cursor.fetchall()]
+
+    cursor.executemany('''
+        UPDATE notification_outbox
+        SET status = 'sending', claimed_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+        WHERE id = ?
+    ''', [(notification['id'],) for notification in notifications])
+    conn.commit()
+
+    for notification in notifications:
+        notification['payload'] = json.loads(notification['payload'])
+        notification['attempts'] += 1
+    return notifications
+
+@retry_on_busy
+def mark_notification_sent(notification_id):
+    """Mark notification as delivered"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE notification_outbox
+        SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL
+        WHERE id = ?
+    ''', (notification_id,))
+    conn.commit()
+
+@retry_on_busy
+def mark_notification_failed(notification_id, error, retry_in=None):
+    """Record a failed attempt; retry after `retry_in` seconds or give up if None"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if retry_in is None:
+        cursor.execute('''
+            UPDATE notification_outbox
+            SET status = 'failed', last_error = ?
+            WHERE id = ?
+        ''', (error, notification_id))
+    else:
+        cursor.execute('''
+            UPDATE notification_outbox
+            SET status = 'pending', last_error = ?, next_attempt_at = datetime('now', ?)
+            WHERE id = ?
+        ''', (error, f'+{int(retry_in)} seconds', notification_id))
+    conn.commit()
+
+@retry_on_busy
+def purge_finished_notifications(batch_size, older_than=86400):
+    """Delete up to `batch_size` sent or failed notifications older than `older_than` seconds"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        DELETE FROM notification_outbox
+        WHERE id IN (
+            SELECT id FROM notification_outbox
+            WHERE status IN ('sent', 'failed') AND next_attempt_at <= datetime('now', ?)
+            LIMIT ?
+        )
+    ''', (f'-{int(older_than)} seconds', batch_size))
+    conn.commit()
+    return cursor.rowcount
+
+# Image job functions
+@retry_on_busy
+def create_image_job(project_id, source_path, source_url):
+    """Queue an uploaded image for transcoding"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO image_jobs (project_id, source_path, source_url)
+        VALUES (?, ?, ?)
+    ''', (project_id, source_path, source_url))
+    job_id = cursor.lastrowid
+    conn.commit()
+    return job_id
+
+@retry_on_busy
+def claim_image_jobs(limit, stale_after=600):
+    """Claim up to `limit` pending jobs, including ones a dead worker left running"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('''
+        UPDATE image_jobs
+        SET status = 'pending'
+        WHERE status = 'running' AND started_at <= datetime('now', ?)
+    ''', (f'-{int(stale_after)} seconds',))
+    cursor.execute('''
+        SELECT * FROM image_jobs
+        WHERE status = 'pending'
+        ORDER BY id
+        LIMIT ?
+    ''', (limit,))
+    jobs = [dict(row) for row in cursor.fetchall()]
+
+    cursor.executemany('''
+        UPDATE image_jobs
+        SET status = 'running', started_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', [(job['id'],) for job in jobs])
+    conn.commit()
+    return jobs
+
+@retry_on_busy
+def finish_image_job(job_id, preview):
+    """Mark a job done and swap the project preview to the processed variants
+
+    The preview is only replaced if the project still shows the image this job
+    was created for; a newer upload wins over a slow job.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE projects
+        SET preview_image = ?, preview_width = ?, preview_height = ?,
+            preview_variants = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = (SELECT project_id FROM image_jobs WHERE id = ?)
+          AND preview_image = (SELECT source_url FROM image_jobs WHERE id = ?)
+    ''', (preview['url'], preview['width'], preview['height'], json.dumps(preview['variants']), job_id, job_id))
+    if cursor.rowcount:
+        _bump_content_version(cursor)
+    cursor.execute('''
+        UPDATE image_jobs
+        SET status = 'done', error = NULL, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (job_id,))
+    conn.commit()
+
+@retry_on_busy
+def fail_image_job(job_id, error):
+    """Mark a job as failed"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE image_jobs
+        SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (error, job_id))
+    conn.commit()
+
+def get_latest_image_jobs():
+    """Get the most recent image job of every project, keyed by project ID"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT * FROM image_jobs
+        WHERE id IN (SELECT MAX(id) FROM image_jobs GROUP BY project_id)
+    ''')
+    jobs = cursor.fetchall()
+    return {job['project_id']: dict(job) for job in jobs}
+
+# Stored file functions (reference counts are kept by triggers on projects)
+@retry_on_busy
+def register_stored_file(name, size, place):
+    """Record an uploaded file; `place()` moves it into place under the write lock
+
+    Holding the lock keeps delete_stored_file from removing a file with the
+    same content between the existence check in `place` and the commit. A
+    file nothing references yet is treated as just released, so the sweeper
+    waits out the grace period before removing it.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('''
+            INSERT INTO stored_files (name, size, released_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (name) DO UPDATE SET
+                size = excluded.size,
+                released_at = CASE WHEN refcount = 0 THEN CURRENT_TIMESTAMP ELSE released_at END
+        ''', (name, size))
+        place()
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def get_unreferenced_files(grace_seconds, limit=500):
+    """Get names of stored files no project has referenced for `grace_seconds`"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT name FROM stored_files
+        WHERE refcount = 0 AND released_at <= datetime('now', ?)
+        ORDER BY released_at
+        LIMIT ?
+    ''', (f'-{int(grace_seconds)} seconds', limit))
+    return [row['name'] for row in cursor.fetchall()]
+
+def get_stored_file_names():
+    """Get the names of all recorded files"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT name FROM stored_files ORDER BY name')
+    return {row['name'] for row in cursor.fetchall()}
+
+@retry_on_busy
+def delete_stored_file(name, grace_seconds, remove):
+    """Forget a file that is unreferenced (or unrecorded) and call `remove(name)` to delete it
+
+    Runs under the write lock, so an upload of the same content cannot claim
+    the file meanwhile. Returns whether the file was removed.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('''
+            SELECT refcount = 0 AND released_at <= datetime('now', ?) AS removable
+            FROM stored_files WHERE name = ?
+        ''', (f'-{int(grace_seconds)} seconds', name))
+        row = cursor.fetchone()
+        if row is not None and not row['removable']:
+            conn.rollback()
+            return False
+        cursor.execute('DELETE FROM stored_files WHERE name = ?', (name,))
+        remove(name)
+        conn.commit()
+        return True
+    except BaseException:
+        conn.rollback()
+        raise
 
 # Tag functions
 def get_all_tags():
@@ -259,9 +710,9 @@ def get_all_tags():
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM tags ORDER BY name')
     tags = cursor.fetchall()
-    conn.close()
     return [dict(tag) for tag in tags]
 
+@retry_on_busy
 def add_tag(name):
     """Add new tag"""
     conn = get_db_connection()
@@ -269,35 +720,23 @@ def add_tag(name):
     try:
         cursor.execute('INSERT INTO tags (name) VALUES (?)', (name,))
         tag_id = cursor.lastrowid
+        _bump_content_version(cursor)
         conn.commit()
-        conn.close()
         return tag_id
     except sqlite3.IntegrityError:
-        conn.close()
+        conn.rollback()
         return None
 
+@retry_on_busy
 def delete_tag(tag_id):
     """Delete tag"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('DELETE FROM tags WHERE id = ?', (tag_id,))
+    _bump_content_version(cursor)
     conn.commit()
-    conn.close()
-
-def get_project_tags(project_id):
-    """Get tags for specific project"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT t.* FROM tags t
-        INNER JOIN project_tags pt ON t.id = pt.tag_id
-        WHERE pt.project_id = ?
-        ORDER BY t.name
-    ''', (project_id,))
-    tags = cursor.fetchall()
-    conn.close()
-    return [dict(tag) for tag in tags]
 
+@retry_on_busy
 def set_project_tags(project_id, tag_ids):
     """Set tags for project (replaces existing tags)"""
     conn = get_db_connection()
@@ -307,28 +746,270 @@ def set_project_tags(project_id, tag_ids):
     cursor.execute('DELETE FROM project_tags WHERE project_id = ?', (project_id,))
 
     # Add new tags
-    for tag_id in tag_ids:
-        cursor.execute('INSERT INTO project_tags (project_id, tag_id) VALUES (?, ?)',
-                      (project_id, tag_id))
+    cursor.executemany('INSERT INTO project_tags (project_id, tag_id) VALUES (?, ?)',
+                       [(project_id, tag_id) for tag_id in tag_ids])
 
+    _bump_content_version(cursor)
     conn.commit()
-    conn.close()
 
-def get_projects_by_tag(tag_id):
-    """Get all projects with specific tag"""
+def get_projects_with_tags():
+    """Get all projects with their tags attached, newest first (the admin list)"""
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute('SELECT * FROM projects ORDER BY created_at DESC')
+    projects = [_project_from_row(project) for project in cursor.fetchall()]
+
+    # Load tags for all projects in one query and group them in Python
     cursor.execute('''
-        SELECT p.* FROM projects p
-        INNER JOIN project_tags pt ON p.id = pt.project_id
-        WHERE pt.tag_id = ?
-        ORDER BY p.created_at DESC
-    ''', (tag_id,))
-    projects = cursor.fetchall()
-    conn.close()
-    return [dict(project) for project in projects]
+        SELECT pt.project_id, t.* FROM project_tags pt
+        INNER JOIN tags t ON t.id = pt.tag_id
+        ORDER BY t.name
+    ''')
+    rows = cursor.fetchall()
+
+    tags_by_project = {}
+    for row in rows:
+        tag = dict(row)
+        tags_by_project.setdefault(tag.pop('project_id'), []).append(tag)
+
+    for project in projects:
+        project['tags'] = tags_by_project.get(project['id'], [])
+
+    return projects
+
+def get_project_cards(limit, after=None, tag_id=None):
+    """Get one page of the portfolio grid, newest first
+
+    Keyset pagination on (created_at, id): `after` is the (created_at, id) of
+    the last card of the previous page. Only the columns a card shows are
+    read; full_description is left to get_project_by_id. Returns the cards
+    with their tags and the key to pass as `after` for the next page (None on
+    the last page).
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    conditions = []
+    params = []
+    if tag_id:
+        conditions.append('EXISTS (SELECT 1 FROM project_tags pt WHERE pt.project_id = p.id AND pt.tag_id = ?)')
+        params.append(tag_id)
+    if after:
+        conditions.append('(p.created_at, p.id) < (?, ?)')
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    # One extra row tells whether there is a next page
+    cursor.execute(f'''
+        SELECT p.id, p.title, p.description, p.preview_image, p.preview_width,
+               p.preview_height, p.preview_variants, p.created_at
+        FROM projects p
+        {where}
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT ?
+    ''', params + [limit + 1])
+    projects = [_project_from_row(project) for project in cursor.fetchall()]
+
+    next_key = None
+    if len(projects) > limit:
+        projects = projects[:limit]
+        next_key = (projects[-1]['created_at'], projects[-1]['id'])
+
+    _attach_tags(cursor, projects)
+    return projects, next_key
+
+def get_project_cards_by_ids(project_ids):
+    """Get the cards of the given projects, in the given order, with their tags"""
+    if not project_ids:
+        return []
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ', '.join('?' * len(project_ids))
+    cursor.execute(f'''
+        SELECT p.id, p.title, p.description, p.preview_image, p.preview_width,
+               p.preview_height, p.preview_variants, p.created_at
+        FROM projects p
+        WHERE p.id IN ({placeholders})
+    ''', list(project_ids))
+    by_id = {row['id']: _project_from_row(row) for row in cursor.fetchall()}
+    projects = [by_id[project_id] for project_id in project_ids if project_id in by_id]
+
+    _attach_tags(cursor, projects)
+    return projects
+
+def get_project_keys():
+    """Get (created_at, id) of every project, newest first (the grid order)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT created_at, id FROM projects ORDER BY created_at DESC, id DESC')
+    return [tuple(row) for row in cursor.fetchall()]
+
+def get_project_versions():
+    """Get {id: updated_at} of every project"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, updated_at FROM projects ORDER BY created_at DESC, id DESC')
+    return {row['id']: row['updated_at'] for row in cursor.fetchall()}
+
+def get_project_tag_pairs():
+    """Get every (project_id, tag_id) pair, grouped by tag"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    # Ordered by the tag index, which covers both columns
+    cursor.execute('SELECT project_id, tag_id FROM project_tags ORDER BY tag_id, project_id')
+    return [tuple(row) for row in cursor.fetchall()]
+
+def _attach_tags(cursor, projects):
+    """Load the tags of a page of projects with one query"""
+    tags_by_project = {}
+    if projects:
+        placeholders = ', '.join('?' * len(projects))
+        cursor.execute(f'''
+            SELECT pt.project_id, t.id, t.name FROM project_tags pt
+            INNER JOIN tags t ON t.id = pt.tag_id
+            WHERE pt.project_id IN ({placeholders})
+            ORDER BY t.name
+        ''', [project['id'] for project in projects])
+        for row in cursor.fetchall():
+            tag = dict(row)
+            tags_by_project.setdefault(tag.pop('project_id'), []).append(tag)
+
+    for project in projects:
+        project['tags'] = tags_by_project.get(project['id'], [])
+
+def search_match_expression(query):
+    """FTS5 query for free text: every word must match, as a prefix
+
+    Words are quoted, so FTS5 operators and punctuation in user input are
+    taken literally. Returns None if the text has no words.
+    """
+    # The index stores "ё" as "е" (see the project_search migration)
+    words = re.findall(r'\w+', query.lower().replace('ё', 'е'))[:SEARCH_MAX_WORDS]
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+def search_projects(query, limit=20):
+    """Full-text search over projects, best match first
+
+    Ranked by bm25 with title matches weighted highest (see the projects_fts
+    migration). Each result has the card fields, its tags and a snippet of
+    the best matching column with the matches between SNIPPET_MARKERS.
+    """
+    match = search_match_expression(query)
+    if match is None:
+        return []
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT p.id, p.title, p.description, p.preview_image, p.preview_width,
+               p.preview_height, p.preview_variants, p.created_at,
+               snippet(projects_fts, -1, ?, ?, '…', 16) AS snippet
+        FROM projects_fts
+        INNER JOIN projects p ON p.id = projects_fts.rowid
+        WHERE projects_fts MATCH ?
+        ORDER BY projects_fts.rank
+        LIMIT ?
+    ''', (*SNIPPET_MARKERS, match, limit))
+    projects = [_project_from_row(project) for project in cursor.fetchall()]
+
+    _attach_tags(cursor, projects)
+    return projects
+
+# Bulk import/export functions
+def iter_projects(batch_size=500):
+    """Yield every project with its tags, by id, reading `batch_size` rows at a time"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    last_id = 0
+    while True:
+        cursor.execute('SELECT * FROM projects WHERE id > ? ORDER BY id LIMIT ?', (last_id, batch_size))
+        projects = [_project_from_row(project) for project in cursor.fetchall()]
+        if not projects:
+            return
+        _attach_tags(cursor, projects)
+        yield from projects
+        last_id = projects[-1]['id']
+
+def _write_project_batch(cursor, batch, tag_ids):
+    # Tags are few and known up front, so only new names are inserted
+    for name in {name for record in batch for name in record['tags']} - tag_ids.keys():
+        cursor.execute('INSERT INTO tags (name) VALUES (?)', (name,))
+        tag_ids[name] = cursor.lastrowid
+
+    rows = [dict(record, preview_variants=json.dumps(record['preview_variants']) if record['preview_variants'] else None)
+            for record in batch]
+    # The last record of a batch wins when several replace the same project
+    replaced = list({row['id']: row for row in rows if row['id']}.values())
+    added = [row for row in rows if not row['id']]
+
+    if replaced:
+        cursor.executemany('''
+            INSERT INTO projects (id, title, description, full_description, preview_image, preview_width,
+                                  preview_height, preview_variants, live_url, created_at, updated_at)
+            VALUES (:id, :title, :description, :full_description, :preview_image, :preview_width,
+                    :preview_height, :preview_variants, :live_url, COALESCE(:created_at, CURRENT_TIMESTAMP), CURRENT_TIMESTAMP)
+            ON CONFLICT (id) DO UPDATE SET
+                title = excluded.title, description = excluded.description,
+                full_description = excluded.full_description, preview_image = excluded.preview_image,
+                preview_width = excluded.preview_width, preview_height = excluded.preview_height,
+                preview_variants = excluded.preview_variants, live_url = excluded.live_url,
+                created_at = COALESCE(:created_at, created_at), updated_at = CURRENT_TIMESTAMP
+        ''', replaced)
+        cursor.executemany('DELETE FROM project_tags WHERE project_id = ?', [(row['id'],) for row in replaced])
+    if added:
+        cursor.executemany('''
+            INSERT INTO projects (title, description, full_description, preview_image, preview_width,
+                                  preview_height, preview_variants, live_url, created_at)
+            VALUES (:title, :description, :full_description, :preview_image, :preview_width,
+                    :preview_height, :preview_variants, :live_url, COALESCE(:created_at, CURRENT_TIMESTAMP))
+        ''', added)
+        # AUTOINCREMENT ids of one statement under the write lock are
+        # consecutive and end at the last inserted rowid
+        cursor.execute('SELECT last_insert_rowid()')
+        first_id = cursor.fetchone()[0] - len(added) + 1
+        for offset, row in enumerate(added):
+            row['id'] = first_id + offset
+
+    cursor.executemany('INSERT OR IGNORE INTO project_tags (project_id, tag_id) VALUES (?, ?)', [
+        (row['id'], tag_ids[name]) for row in replaced + added for name in row['tags']
+    ])
+
+def write_projects(records, batch_size=1000):
+    """Write projects from an iterable of records in one transaction; returns how many were written
+
+    A record has the projects columns (preview_variants as a list,
+    created_at optional) and `tags`, a list of tag names; missing tags are
+    created. A record with an `id` replaces that project and its tags, the
+    others are added. `records` is consumed lazily, `batch_size` at a time
+    per executemany, so it can stream from a file. Not retried when the
+    database is busy, since the records can only be read once.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('SELECT id, name FROM tags')
+        tag_ids = {row['name']: row['id'] for row in cursor.fetchall()}
+        records = iter(records)
+        written = 0
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            _write_project_batch(cursor, batch, tag_ids)
+            written += len(batch)
+        if written:
+            _bump_content_version(cursor)
+        conn.commit()
+        return written
+    except BaseException:
+        conn.rollback()
+        raise
 
 if __name__ == '__main__':
-    init_db()
-    insert_sample_data()
-    print("Database initialized successfully!")
\ No newline at end of file
+    # Kept for old instructions; the schema lives in migrations.py
+    from migrations import migrate
+    migrate()
+    print("Database initialized successfully!")
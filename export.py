@@ -0,0 +1,233 @@
+"""
+Static export of the public site
+
+Writes the read-only public pages as files a front-end server can serve
+without Python: the portfolio page (index.html), one page per tag
+(tags/<id>.html, what the tag bar links to as ?tags=<id>) and the JSON of
+every project (project/<id>.json), each with .gz/.br copies. Later pages,
+combined tag filters and search stay dynamic.
+
+An export only rewrites what changed since the previous one, as recorded in
+manifest.json. A page is rendered when its fingerprint changes: the cards,
+tag counts and next-page key it would show, worked out from the tag index
+without rendering. A project file is rendered when the project was updated
+at or after the previous export (timestamps have one-second resolution).
+
+In the web workers a thread exports after every admin change and polls the
+content version, which also picks up previews swapped by the image worker:
+
+    python export.py           # write the changes to EXPORT_DIR (default export)
+    python export.py --full    # rewrite every file
+    python export.py --best    # compress at the best (slow) level
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+
+import assets
+import compression
+import tag_index
+from database import get_content_version, get_project_cards_by_ids, get_project_versions
+from translations import get_translations
+
+logger = logging.getLogger(__name__)
+
+# Output directory; the web workers only export when it is set
+EXPORT_DIR = os.getenv('EXPORT_DIR', '')
+# Seconds between content version checks of the export thread
+POLL_INTERVAL = float(os.getenv('EXPORT_POLL_INTERVAL', 5))
+
+MANIFEST = 'manifest.json'
+# Bump when the layout of the export changes, so the next export is full
+FORMAT = 1
+
+_app = None
+_wakeup = threading.Event()
+_thread = None
+_thread_lock = threading.Lock()
+
+def _page_path(selection):
+    return f'tags/{selection[0]}.html' if selection else 'index.html'
+
+def _project_path(project_id):
+    return f'project/{project_id}.json'
+
+def _site_digest(app):
+    """Digest of what every page depends on besides the data: templates, assets and translations"""
+    digest = hashlib.sha256(f'{FORMAT}:{assets.manifest_digest()}'.encode('utf-8'))
+    for name in sorted(app.jinja_env.list_templates()):
+        digest.update(app.jinja_loader.get_source(app.jinja_env, name)[0].encode('utf-8'))
+    digest.update(json.dumps(get_translations('ru'), ensure_ascii=False, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+def _write_file(output_dir, path, data):
+    file_path = os.path.join(output_dir, path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # Written aside and renamed, so the server never sends a partial file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix='.export-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def _remove_file(output_dir, path):
+    for suffix in ('',) + tuple(compression.EXTENSIONS.values()):
+        try:
+            os.remove(os.path.join(output_dir, path + suffix))
+        except FileNotFoundError:
+            pass
+
+def _write(output_dir, path, body, best):
+    """Write `body` to `path` with the compressed copies worth keeping"""
+    _write_file(output_dir, path, body)
+    encoded = compression.compress_all(body, best) if len(body) >= compression.MIN_SIZE else {}
+    for encoding, extension in compression.EXTENSIONS.items():
+        if encoding in encoded and len(encoded[encoding]) < len(body):
+            _write_file(output_dir, path + extension, encoded[encoding])
+        else:
+            # A copy of the previous content would be served instead
+            try:
+                os.remove(os.path.join(output_dir, path + extension))
+            except FileNotFoundError:
+                pass
+
+def _render(app, view, path, query_string=None, **view_args):
+    # The view itself, without the hooks of a full request; with no
+    # Accept-Encoding in the request the body comes back uncompressed
+    with app.test_request_context(path, query_string=query_string):
+        return app.view_functions[view](**view_args).get_data()
+
+def _read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _export(app, output_dir, full, best):
+    site = _site_digest(app)
+    manifest = _read_manifest(output_dir)
+    if manifest.get('site') != site:
+        full = True
+    # Taken before the data is read, like the page cache
+    version = get_content_version()
+    if not full and manifest.get('version') == version['version']:
+        return []
+
+    written = []
+    since = None if full else manifest.get('updated_at')
+    exported_projects = set(manifest.get('projects', []))
+    project_versions = get_project_versions()
+    for project_id, updated_at in project_versions.items():
+        # Same second as the previous export: it may have changed after it
+        if since is None or project_id not in exported_projects or updated_at >= since:
+            path = _project_path(project_id)
+            _write(output_dir, path, _render(app, 'get_project', f'/project/{project_id}', project_id=project_id), best)
+            written.append(path)
+    for project_id in exported_projects - project_versions.keys():
+        _remove_file(output_dir, _project_path(project_id))
+
+    index = tag_index.get_index(version)
+    page_size = app.config['PROJECTS_PAGE_SIZE']
+    grids = {}
+    for selection in [()] + [(tag['id'],) for tag in index.tags]:
+        bits = index.match(selection)
+        project_ids, next_key = index.page(bits, page_size)
+        grids[selection] = project_ids, next_key, index.facets(bits)
+    cards = {card['id']: card for card in get_project_cards_by_ids({i for ids, _, _ in grids.values() for i in ids})}
+
+    exported_pages = {} if full else manifest.get('pages', {})
+    pages = {}
+    for selection, (project_ids, next_key, facets) in grids.items():
+        path = _page_path(selection)
+        fingerprint = hashlib.sha256(json.dumps([
+            [cards.get(i) for i in project_ids], next_key, sorted(facets.items()),
+            [(tag['id'], tag['name']) for tag in index.tags], len(index.keys),
+        ], ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+        pages[path] = fingerprint
+        if exported_pages.get(path) != fingerprint:
+            query_string = {'tags': str(selection[0])} if selection else None
+            _write(output_dir, path, _render(app, 'index', '/', query_string), best)
+            written.append(path)
+    for path in manifest.get('pages', {}).keys() - pages.keys():
+        _remove_file(output_dir, path)
+
+    # Written last: an interrupted export is redone from the previous manifest
+    _write_file(output_dir, MANIFEST, json.dumps({
+        'site': site,
+        'version': version['version'],
+        'updated_at': version['updated_at'],
+        'pages': pages,
+        'projects': sorted(project_versions),
+    }).encode('utf-8'))
+    return written
+
+def export(app, output_dir=None, full=False, best=False):
+    """Write the pages and project files that changed to `output_dir`; returns their paths
+
+    Exports from several workers are serialized by a lock file, so the last
+    one to run writes the newest content.
+    """
+    output_dir = output_dir or EXPORT_DIR or 'export'
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return _export(app, output_dir, full, best)
+
+def run_exporter(app, stop_event=None, interval=POLL_INTERVAL):
+    """Export whenever the content version changes, until `stop_event` is set"""
+    stop_event = stop_event or threading.Event()
+    exported_version = None
+    while not stop_event.is_set():
+        try:
+            version = get_content_version()['version']
+            if version != exported_version:
+                written = export(app)
+                if written:
+                    logger.info(f"Exported {len(written)} file(s) to {EXPORT_DIR}")
+                exported_version = version
+        except Exception:
+            logger.exception("Static export failed")
+        _wakeup.wait(interval)
+        _wakeup.clear()
+
+def start():
+    """Start this process's export thread if EXPORT_DIR is set (once)"""
+    global _thread
+    if not EXPORT_DIR or _app is None:
+        return
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=run_exporter, args=(_app,), daemon=True, name='static-export')
+            _thread.start()
+
+def schedule():
+    """Export soon, after an admin change"""
+    start()
+    _wakeup.set()
+
+def init_app(app):
+    """Let schedule() and start() export `app`"""
+    global _app
+    _app = app
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    from app import app
+
+    output_dir = EXPORT_DIR or 'export'
+    written = export(app, output_dir, full='--full' in sys.argv, best='--best' in sys.argv)
+    print(f"Wrote {len(written)} file(s) to {output_dir}")
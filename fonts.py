@@ -0,0 +1,133 @@
+"""
+Self-hosted web fonts
+
+The fonts are served from static/fonts; the @font-face rules are inlined in
+the page head together with preload hints, so first paint does not wait for
+a third-party stylesheet.
+
+Inter (https://rsms.me/inter, SIL Open Font License 1.1) is committed as two
+subsets of its variable font, Latin and Cyrillic, with the weight axis cut to
+300-700 and the optical size fixed at text size, which is what the Google
+Fonts stylesheet used to serve. The unicode-range of each face lets the
+browser download only the subsets a page actually uses.
+
+To update the files, subset a release of Inter (needs fontTools and Brotli,
+`pip install fonttools brotli`) and commit the result:
+
+    python fonts.py InterVariable.woff2
+"""
+import os
+import sys
+from markupsafe import Markup
+
+# Code points of the Google Fonts latin and cyrillic subsets
+LATIN = (
+    'U+0000-00FF, U+0131, U+0152-0153, U+02BB-02BC, U+02C6, U+02DA, U+02DC, U+0304, U+0308, '
+    'U+0329, U+2000-206F, U+20AC, U+2122, U+2191, U+2193, U+2212, U+2215, U+FEFF, U+FFFD'
+)
+CYRILLIC = 'U+0301, U+0400-045F, U+0490-0491, U+04B0-04B1, U+2116'
+
+# `preload` marks the faces needed for first paint (the hero name is Cyrillic)
+FONT_FACES = (
+    {'family': 'Inter', 'file': 'fonts/inter-cyrillic.woff2', 'weight': '300 700',
+     'unicode_range': CYRILLIC, 'preload': True},
+    {'family': 'Inter', 'file': 'fonts/inter-latin.woff2', 'weight': '300 700',
+     'unicode_range': LATIN, 'preload': False},
+)
+
+# Axes of the subsets: the weights the site uses, and text optical size
+WEIGHT_RANGE = (300, 700)
+OPTICAL_SIZE = 14
+# Family, style, version and the license notice required by the OFL
+NAME_IDS = [0, 1, 2, 3, 4, 5, 6, 11, 13, 14]
+
+def is_woff2(path):
+    """Whether `path` exists and is a woff2 font (not e.g. a saved error page)"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(4) == b'wOF2'
+    except OSError:
+        return False
+
+def available_faces(static_folder):
+    """Faces whose font file is present and valid"""
+    return [face for face in FONT_FACES if is_woff2(os.path.join(static_folder, face['file']))]
+
+def font_face_css():
+    """Inline @font-face rules for the available fonts"""
+    from flask import current_app
+    from assets import asset_url
+
+    rules = []
+    for face in available_faces(current_app.static_folder):
+        unicode_range = f" unicode-range: {face['unicode_range']};" if face.get('unicode_range') else ''
+        rules.append(
+            f"@font-face {{ font-family: '{face['family']}'; font-style: normal; "
+            f"font-weight: {face['weight']}; font-display: swap; "
+            f"src: url('{asset_url(face['file'])}') format('woff2');{unicode_range} }}"
+        )
+    return Markup('\n'.join(rules))
+
+def font_preloads():
+    """URLs of the fonts to preload"""
+    from flask import current_app
+    from assets import asset_url
+
+    return [asset_url(face['file']) for face in available_faces(current_app.static_folder) if face['preload']]
+
+def _unicodes(unicode_range):
+    """Code points of a CSS unicode-range"""
+    unicodes = []
+    for part in unicode_range.split(','):
+        start, _, end = part.strip()[2:].partition('-')
+        unicodes.extend(range(int(start, 16), int(end or start, 16) + 1))
+    return unicodes
+
+def subset_fonts(source, static_folder='static'):
+    """Write the subsets in FONT_FACES from the Inter variable font `source`"""
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+    from fontTools.varLib import instancer
+
+    written = []
+    for face in FONT_FACES:
+        font = TTFont(source)
+        axes = {axis.axisTag for axis in font['fvar'].axes} if 'fvar' in font else set()
+        if 'wght' not in axes:
+            raise RuntimeError(f"{source} is not a variable font with a weight axis")
+        options = subset.Options()
+        options.name_IDs = NAME_IDS
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=_unicodes(face['unicode_range']))
+        subsetter.subset(font)
+
+        limits = {'wght': WEIGHT_RANGE}
+        if 'opsz' in axes:
+            limits['opsz'] = OPTICAL_SIZE
+        font = instancer.instantiateVariableFont(font, limits)
+        font.flavor = 'woff2'
+        font.save(os.path.join(static_folder, face['file']))
+        written.append(face['file'])
+    return written
+
+def init_app(app):
+    """Make the font helpers available to templates"""
+    app.add_template_global(font_face_css)
+    app.add_template_global(font_preloads)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python fonts.py <Inter variable font (.ttf/.woff2)>")
+        sys.exit(1)
+
+    try:
+        files = subset_fonts(sys.argv[1])
+    except ImportError as e:
+        print(f"{e}: install fontTools and Brotli (pip install fonttools brotli)")
+        sys.exit(1)
+    except (OSError, RuntimeError) as e:
+        print(f"Subsetting failed: {e}")
+        sys.exit(1)
+    for name in files:
+        size = os.path.getsize(os.path.join('static', name))
+        print(f"Saved {name} ({size // 1024} KB)")
@@ -1,12 +1,16 @@
 # Gunicorn configuration for production
+# (the hooks import project modules, which load .env through config.py)
 
 # Server socket
 bind = "127.0.0.1:8001"
 backlog = 2048
 
 # Worker processes
+# gthread workers let long-polling /api/check_auth requests wait on a cheap
+# idle thread instead of tying up a whole sync worker
 workers = 3
-worker_class = "sync"
+worker_class = "gthread"
+threads = 32
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -39,4 +43,36 @@ limit_request_field_size = 8190
 
 # SSL (будет настроено позже)
 # keyfile = "/etc/ssl/private/mshkdev.ru.key"
-# certfile = "/etc/ssl/certs/mshkdev.ru.crt"
\ No newline at end of file
+# certfile = "/etc/ssl/certs/mshkdev.ru.crt"
+
+# Server hooks
+def on_starting(server):
+    """Apply pending database migrations and drop metrics snapshots left by the previous run"""
+    # Runs once in the master, before any worker imports the app, so the
+    # workers only check the schema version
+    import migrations
+    from database import close_db_connections
+    migrations.migrate()
+    close_db_connections()
+
+    import metrics
+    metrics.reset()
+
+def post_worker_init(worker):
+    """Start the worker's static export thread (only with EXPORT_DIR set)"""
+    import export
+    export.start()
+
+def worker_exit(server, worker):
+    """Close the worker's persistent database connections when it is recycled"""
+    from database import close_db_connections
+    close_db_connections()
+
+    # Keep the requests this worker served in /metrics
+    import metrics
+    metrics.retire()
+
+def child_exit(server, worker):
+    """Keep the metrics of a worker that was killed before worker_exit ran"""
+    import metrics
+    metrics.retire(worker.pid)
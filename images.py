@@ -0,0 +1,192 @@
+"""
+Preview image processing
+
+Uploaded previews are resized into several widths and re-encoded as AVIF
+(when Pillow has AVIF support) and WebP, without EXIF or other metadata.
+The variants and their dimensions are stored with the project and rendered
+as a responsive srcset in index.html and in the project modal.
+
+Uploads are not processed in the web request: the admin view queues an
+image job and the worker below transcodes it in a process pool, then swaps
+the project preview to the variants.
+
+    python images.py          # (re)process existing projects that have no variants
+    python images.py worker   # process queued image jobs until stopped
+    python images.py worker --once
+"""
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import config
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow is optional: without it uploads are served as-is
+    Image = None
+
+VARIANT_WIDTHS = (320, 640, 960, 1280)
+
+# Width of the variant used as the plain <img src> fallback
+FALLBACK_WIDTH = 960
+
+# Worker processes (default: one per CPU) and seconds between queue polls
+WORKER_PROCESSES = int(os.getenv('IMAGE_WORKER_PROCESSES', 0)) or os.cpu_count() or 1
+WORKER_POLL_INTERVAL = float(os.getenv('IMAGE_WORKER_POLL_INTERVAL', 2))
+
+logger = logging.getLogger(__name__)
+
+# Best format first; browsers pick the first <source> they support
+FORMATS = (
+    ('avif', 'image/avif', {'quality': 55}),
+    ('webp', 'image/webp', {'quality': 80, 'method': 6}),
+)
+
+def available_formats():
+    """Output formats supported by the installed Pillow"""
+    if Image is None:
+        return []
+    return [fmt for fmt in FORMATS if features.check(fmt[0])]
+
+def _prepare(image):
+    # Apply the EXIF orientation before the metadata is dropped
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+def process_image(source_path, output_dir, url_prefix):
+    """Generate resized variants of an image
+
+    Returns a dict with the fallback `url`, its `width`/`height` and the list
+    of `variants` (url, type, width, height), or None if the image cannot be
+    processed (Pillow missing or not an image).
+    """
+    formats = available_formats()
+    if not formats:
+        return None
+
+    try:
+        with Image.open(source_path) as original:
+            image = _prepare(original)
+    except (OSError, ValueError):
+        return None
+
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    source_width, source_height = image.size
+
+    # Never upscale; images narrower than the largest width also get a variant at their own size
+    widths = [w for w in VARIANT_WIDTHS if w < source_width]
+    if source_width <= VARIANT_WIDTHS[-1]:
+        widths.append(source_width)
+
+    variants = []
+    for width in widths:
+        height = max(1, round(source_height * width / source_width))
+        resized = image if width == source_width else image.resize((width, height), Image.LANCZOS)
+        for extension, mimetype, options in formats:
+            filename = f"{stem}-{width}w.{extension}"
+            # No exif/icc arguments: the output carries no metadata
+            resized.save(os.path.join(output_dir, filename), extension.upper(), **options)
+            variants.append({
+                'url': f"{url_prefix}/{filename}",
+                'type': mimetype,
+                'width': width,
+                'height': height,
+            })
+
+    # Fallback for <img src>: the WebP variant closest to FALLBACK_WIDTH
+    webp = [v for v in variants if v['type'] == 'image/webp'] or variants
+    fallback = min(webp, key=lambda v: abs(v['width'] - FALLBACK_WIDTH))
+    return {
+        'url': fallback['url'],
+        'width': fallback['width'],
+        'height': fallback['height'],
+        'variants': variants,
+    }
+
+def process_existing_projects(static_root='.'):
+    """Process previews of projects that do not have variants yet"""
+    from database import get_all_projects, set_project_preview
+
+    processed = 0
+    for project in get_all_projects():
+        image_url = project['preview_image'] or ''
+        if project['preview_variants'] or not image_url.startswith('/static/'):
+            continue
+
+        source_path = os.path.join(static_root, image_url.lstrip('/'))
+        if not os.path.exists(source_path):
+            continue
+
+        result = process_image(source_path, os.path.dirname(source_path), os.path.dirname(image_url))
+        if result:
+            set_project_preview(project['id'], result['url'], result['width'], result['height'], result['variants'])
+            processed += 1
+    return processed
+
+def _process_job(job):
+    # Runs in a pool process; variants are written next to the original
+    return process_image(job['source_path'], os.path.dirname(job['source_path']), os.path.dirname(job['source_url']))
+
+def process_jobs(pool, limit):
+    """Claim up to `limit` queued jobs, transcode them in `pool` and record the results
+
+    Returns the number of jobs claimed.
+    """
+    from database import claim_image_jobs, finish_image_job, fail_image_job
+
+    jobs = claim_image_jobs(limit)
+    futures = {pool.submit(_process_job, job): job for job in jobs}
+    for future in as_completed(futures):
+        job = futures[future]
+        try:
+            preview = future.result()
+        except Exception as e:
+            logger.exception(f"Image job {job['id']} failed")
+            fail_image_job(job['id'], str(e))
+            continue
+
+        if preview:
+            finish_image_job(job['id'], preview)
+            logger.info(f"Image job {job['id']}: {len(preview['variants'])} variant(s) for project {job['project_id']}")
+        else:
+            fail_image_job(job['id'], 'not an image or no supported output format')
+    return len(jobs)
+
+def run_worker(stop_event=None, processes=WORKER_PROCESSES, once=False):
+    """Process image jobs until `stop_event` is set (or the queue is empty with `once`)"""
+    stop_event = stop_event or threading.Event()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        while not stop_event.is_set():
+            try:
+                claimed = process_jobs(pool, processes)
+            except Exception:
+                logger.exception("Image worker pass failed")
+                claimed = 0
+            if claimed:
+                continue
+            if once:
+                break
+            stop_event.wait(WORKER_POLL_INTERVAL)
+
+if __name__ == '__main__':
+    if Image is None:
+        print("Pillow is not installed: pip install Pillow")
+        sys.exit(1)
+
+    from migrations import ensure_schema
+    ensure_schema()
+
+    if 'worker' in sys.argv[1:]:
+        logging.basicConfig(
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            level=logging.INFO
+        )
+        try:
+            run_worker(once='--once' in sys.argv)
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(f"Processed {process_existing_projects()} project preview(s)")
@@ -0,0 +1,104 @@
+"""
+Periodic database maintenance: purge expired auth sessions and delivered
+notifications in bounded batches, and optionally reclaim free pages, refresh
+planner statistics and sweep unreferenced uploads (see storage.py).
+
+Runs as a thread inside the bot process (see bot.py) or standalone:
+
+    python maintenance.py                      # one purge pass
+    python maintenance.py --vacuum --analyze   # plus incremental VACUUM and ANALYZE
+    python maintenance.py --sweep              # plus removing unreferenced uploads
+"""
+import logging
+import os
+import sys
+import threading
+import time
+
+from database import (
+    get_db_connection, purge_expired_auth_sessions, purge_finished_notifications
+)
+import storage
+
+logger = logging.getLogger(__name__)
+
+# Seconds between passes, and every how many passes to vacuum/analyze
+INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL', 300))
+OPTIMIZE_EVERY = int(os.getenv('MAINTENANCE_OPTIMIZE_EVERY', 12))
+
+# Rows deleted per transaction; keeps the write lock short for the web workers
+BATCH_SIZE = 500
+# Pages returned to the OS per incremental VACUUM step
+VACUUM_PAGES = 1000
+
+def _purge(purge_batch):
+    deleted = 0
+    while True:
+        count = purge_batch(BATCH_SIZE)
+        deleted += count
+        if count < BATCH_SIZE:
+            return deleted
+
+def run_maintenance_pass(vacuum=False, analyze=False, sweep=False):
+    """Run one maintenance pass and return what it did"""
+    started = time.perf_counter()
+    stats = {
+        'auth_sessions': _purge(purge_expired_auth_sessions),
+        'notifications': _purge(purge_finished_notifications),
+        'vacuumed_pages': 0,
+        'files_removed': 0,
+    }
+
+    conn = get_db_connection()
+    if vacuum:
+        # Only databases created with auto_vacuum = INCREMENTAL can do this
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            conn.execute(f'PRAGMA incremental_vacuum({VACUUM_PAGES})').fetchall()
+            stats['vacuumed_pages'] = min(free_pages, VACUUM_PAGES)
+        else:
+            logger.info("Skipping incremental VACUUM: auto_vacuum is not INCREMENTAL on this database")
+    if analyze:
+        # Lets SQLite decide which tables need new statistics
+        conn.execute('PRAGMA optimize')
+    if sweep:
+        stats['files_removed'] = len(storage.sweep())
+
+    stats['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(
+        f"Maintenance pass: removed {stats['auth_sessions']} auth sessions and "
+        f"{stats['notifications']} notifications, vacuumed {stats['vacuumed_pages']} pages, "
+        f"removed {stats['files_removed']} files in {stats['duration_ms']} ms"
+    )
+    return stats
+
+def run_maintenance(stop_event=None, interval=INTERVAL):
+    """Run maintenance passes until `stop_event` is set"""
+    stop_event = stop_event or threading.Event()
+    passes = 0
+    while not stop_event.wait(interval):
+        passes += 1
+        optimize = OPTIMIZE_EVERY > 0 and passes % OPTIMIZE_EVERY == 0
+        try:
+            run_maintenance_pass(vacuum=optimize, analyze=optimize, sweep=optimize)
+        except Exception:
+            logger.exception("Maintenance pass failed")
+
+def start_maintenance_thread():
+    """Run maintenance in a daemon thread; returns the event that stops it"""
+    stop_event = threading.Event()
+    threading.Thread(target=run_maintenance, args=(stop_event,), daemon=True, name='db-maintenance').start()
+    return stop_event
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    from migrations import ensure_schema
+    ensure_schema()
+
+    run_maintenance_pass(
+        vacuum='--vacuum' in sys.argv, analyze='--analyze' in sys.argv, sweep='--sweep' in sys.argv
+    )
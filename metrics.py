@@ -0,0 +1,286 @@
+"""
+Request, query and template timing metrics
+
+Every process (each gunicorn worker, the bot) keeps its own histograms and
+periodically writes them to METRICS_DIR/metrics-<pid>.json. /metrics sums the
+files of all processes and renders them in the Prometheus text format.
+
+When a process exits, its snapshot is added to METRICS_DIR/metrics-retired.json
+and removed (see retire()), so recycled workers neither leave files behind
+nor lose their counts, and a new process reusing the pid does not replace
+them: the totals never go down while the server runs.
+
+Recorded:
+    http_request_duration_seconds{route, method, status}
+    db_query_duration_seconds{function}    - statement execution, per caller
+    db_fetch_seconds_total{function}       - time spent fetching rows
+    template_render_duration_seconds{template}
+    external_request_duration_seconds{service}
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from database import DATABASE_PATH, set_query_observer
+
+METRICS_DIR = os.getenv('METRICS_DIR', f'{DATABASE_PATH}-metrics')
+# Seconds between snapshots of this process's metrics
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HELP = {
+    'http_request_duration_seconds': ('histogram', 'Time spent handling HTTP requests'),
+    'db_query_duration_seconds': ('histogram', 'Time spent executing SQLite statements'),
+    'db_fetch_seconds_total': ('counter', 'Time spent fetching SQLite result rows'),
+    'template_render_duration_seconds': ('histogram', 'Time spent rendering Jinja templates'),
+    'external_request_duration_seconds': ('histogram', 'Time spent in calls to external services'),
+}
+
+# name -> label key (JSON list of [label, value]) -> series
+_histograms = {}
+_counters = {}
+_lock = threading.Lock()
+_flusher_pid = None
+# Process whose snapshot file flush() last wrote
+_snapshot_pid = None
+# Set by retire() when this process exits; later flushes would count twice
+_retired = False
+_local = threading.local()
+
+def _label_key(labels):
+    return json.dumps(sorted(labels.items()))
+
+def observe(name, seconds, **labels):
+    """Record a duration in histogram `name`"""
+    key = _label_key(labels)
+    with _lock:
+        series = _histograms.setdefault(name, {}).get(key)
+        if series is None:
+            series = _histograms[name][key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                series['buckets'][i] += 1
+                break
+        series['sum'] += seconds
+        series['count'] += 1
+    _ensure_flusher()
+
+def increment(name, amount=1, **labels):
+    """Add `amount` to counter `name`"""
+    key = _label_key(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+    _ensure_flusher()
+
+@contextmanager
+def timed(name, **labels):
+    """Context manager recording the duration of its block"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+def _record_query(function, seconds, fetch):
+    if fetch:
+        increment('db_fetch_seconds_total', seconds, function=function)
+    else:
+        observe('db_query_duration_seconds', seconds, function=function)
+
+# Snapshots
+
+RETIRED = 'metrics-retired.json'
+
+def _snapshot_path(pid):
+    return os.path.join(METRICS_DIR, f'metrics-{pid}.json')
+
+@contextmanager
+def _locked(mode):
+    """Lock METRICS_DIR: shared to read the totals, exclusive to move counts between files"""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with open(os.path.join(METRICS_DIR, '.lock'), 'w') as lock:
+        fcntl.flock(lock, mode)
+        yield
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write(path, data):
+    # Readers never see a half-written file
+    with open(f'{path}.tmp', 'w') as f:
+        f.write(data)
+    os.replace(f'{path}.tmp', path)
+
+def _add(histograms, counters, data):
+    """Add the series of a snapshot to `histograms` and `counters`"""
+    for metric, series in data['histograms'].items():
+        for key, values in series.items():
+            total = histograms.setdefault(metric, {}).setdefault(
+                key, {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            )
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], values['buckets'])]
+            total['sum'] += values['sum']
+            total['count'] += values['count']
+    for metric, series in data['counters'].items():
+        for key, value in series.items():
+            counters.setdefault(metric, {})
+            counters[metric][key] = counters[metric].get(key, 0) + value
+
+def _retire(pid):
+    # Call with the exclusive lock held
+    path = _snapshot_path(pid)
+    data = _read(path)
+    if data is None:
+        return
+    retired_path = os.path.join(METRICS_DIR, RETIRED)
+    retired = _read(retired_path) or {'histograms': {}, 'counters': {}}
+    _add(retired['histograms'], retired['counters'], data)
+    _write(retired_path, json.dumps(retired))
+    os.remove(path)
+
+def retire(pid=None):
+    """Move the snapshot of process `pid` into the retired totals
+
+    Without `pid`, flushes this process first: call it when the process
+    exits. Does nothing if the snapshot is already gone.
+    """
+    global _retired
+    if pid is None:
+        flush()
+        pid = os.getpid()
+    with _locked(fcntl.LOCK_EX):
+        if pid == os.getpid():
+            _retired = True
+        _retire(pid)
+
+def flush():
+    """Write this process's metrics to METRICS_DIR"""
+    global _snapshot_pid
+    with _lock:
+        data = json.dumps({'histograms': _histograms, 'counters': _counters})
+    pid = os.getpid()
+    with _locked(fcntl.LOCK_EX):
+        if _retired:
+            return
+        if _snapshot_pid != pid:
+            # A file with this pid is left by an earlier process that exited
+            # without retire(): keep its counts instead of overwriting them
+            _retire(pid)
+            _snapshot_pid = pid
+        _write(_snapshot_path(pid), data)
+
+def _run_flusher():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+def _ensure_flusher():
+    # One flusher thread per process, started again in forked children
+    global _flusher_pid
+    if _flusher_pid != os.getpid():
+        with _lock:
+            if _flusher_pid != os.getpid():
+                _flusher_pid = os.getpid()
+                threading.Thread(target=_run_flusher, daemon=True, name='metrics-flush').start()
+
+def reset():
+    """Forget the snapshots and retired totals of earlier runs (call once when the server starts)"""
+    if os.path.isdir(METRICS_DIR):
+        for name in os.listdir(METRICS_DIR):
+            if name.startswith('metrics-'):
+                os.remove(os.path.join(METRICS_DIR, name))
+
+def collect():
+    """Sum the snapshots of all processes and the retired totals"""
+    histograms, counters = {}, {}
+    if not os.path.isdir(METRICS_DIR):
+        return histograms, counters
+    # Not while counts are moved to the retired totals, or they would be seen twice
+    with _locked(fcntl.LOCK_SH):
+        for name in os.listdir(METRICS_DIR):
+            if not name.startswith('metrics-') or not name.endswith('.json'):
+                continue
+            data = _read(os.path.join(METRICS_DIR, name))
+            if data is not None:
+                _add(histograms, counters, data)
+    return histograms, counters
+
+def _format_labels(key, extra=()):
+    labels = [(name, value) for name, value in json.loads(key)] + list(extra)
+    if not labels:
+        return ''
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in labels]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+def render():
+    """All processes' metrics in the Prometheus text exposition format"""
+    flush()
+    histograms, counters = collect()
+    lines = []
+    for metric in sorted(histograms):
+        kind, description = HELP.get(metric, ('histogram', metric))
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} {kind}']
+        for key, series in sorted(histograms[metric].items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, series['buckets']):
+                cumulative += count
+                lines.append(f'{metric}_bucket{_format_labels(key, [("le", bound)])} {cumulative}')
+            lines.append(f'{metric}_bucket{_format_labels(key, [("le", "+Inf")])} {series["count"]}')
+            lines.append(f'{metric}_sum{_format_labels(key)} {series["sum"]:.6f}')
+            lines.append(f'{metric}_count{_format_labels(key)} {series["count"]}')
+    for metric in sorted(counters):
+        kind, description = HELP.get(metric, ('counter', metric))
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} {kind}']
+        for key, value in sorted(counters[metric].items()):
+            lines.append(f'{metric}{_format_labels(key)} {value:.6f}')
+    return '\n'.join(lines) + '\n'
+
+# Flask integration
+
+def _before_request():
+    from flask import g
+    g.metrics_started = time.perf_counter()
+
+def _after_request(response):
+    from flask import g, request
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        observe(
+            'http_request_duration_seconds', time.perf_counter() - started,
+            route=route, method=request.method, status=response.status_code
+        )
+    return response
+
+def _before_render_template(sender, template, context, **extra):
+    _local.__dict__.setdefault('render_started', []).append(time.perf_counter())
+
+def _template_rendered(sender, template, context, **extra):
+    stack = getattr(_local, 'render_started', None)
+    if stack:
+        observe('template_render_duration_seconds', time.perf_counter() - stack.pop(), template=template.name)
+
+def init_app(app):
+    """Time requests and template rendering of `app`, and queries in database.py
+
+    Call before registering other after_request hooks (e.g. compression) so
+    their work is included in the request duration.
+    """
+    from flask import before_render_template, template_rendered
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+    set_query_observer(_record_query)
@@ -0,0 +1,360 @@
+"""
+Versioned schema migrations
+
+The schema version is kept in the database header (PRAGMA user_version).
+Pending migrations run once, in order and in a single transaction, from the
+CLI or from gunicorn's on_starting hook; every other process only compares
+the version (ensure_schema), which costs one PRAGMA read.
+
+To change the schema, append a function to MIGRATIONS; never edit one that
+has already shipped.
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # show the current and latest version
+"""
+import logging
+import sys
+from database import get_db_connection, get_storage_settings, retry_on_busy
+
+logger = logging.getLogger(__name__)
+
+def _add_column_if_missing(cursor, table, column, definition):
+    """Add a column to an existing table (CREATE TABLE IF NOT EXISTS will not)"""
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def initial_schema(cursor):
+    """Tables and indexes as they were before versioning
+
+    Written with IF NOT EXISTS so that databases created by the old init_db()
+    (user_version 0, full schema) are adopted as they are.
+    """
+    # Projects table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS projects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL,
+            full_description TEXT NOT NULL,
+            preview_image TEXT,
+            live_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Auth sessions table for Telegram authentication
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS auth_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_token TEXT UNIQUE NOT NULL,
+            telegram_user_id INTEGER,
+            username TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            approved_at TIMESTAMP
+        )
+    ''')
+
+    # Admin users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS admin_users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_user_id INTEGER UNIQUE NOT NULL,
+            username TEXT,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Tags table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Project tags relationship table (many-to-many)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS project_tags (
+            project_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (project_id, tag_id),
+            FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE,
+            FOREIGN KEY (tag_id) REFERENCES tags (id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Public content version, bumped by every admin mutation so that all
+    # workers can tell when their cached pages are stale
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS content_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO content_version (id) VALUES (1)')
+
+    # Outgoing Telegram messages, sent by the dispatcher in notifications.py
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payload TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            claimed_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''')
+
+    # Responsive preview variants generated by images.py
+    _add_column_if_missing(cursor, 'projects', 'preview_width', 'INTEGER')
+    _add_column_if_missing(cursor, 'projects', 'preview_height', 'INTEGER')
+    _add_column_if_missing(cursor, 'projects', 'preview_variants', 'TEXT')
+
+    # Image transcoding jobs, processed by the worker in images.py
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER NOT NULL,
+            source_path TEXT NOT NULL,
+            source_url TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Indexes for the hot queries; check_query_plans.py verifies they are used
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_projects_created_at ON projects (created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_project_tags_tag_id ON project_tags (tag_id, project_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_auth_sessions_expires_at ON auth_sessions (expires_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notification_outbox_status ON notification_outbox (status, next_attempt_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_jobs_status ON image_jobs (status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_jobs_project_id ON image_jobs (project_id)')
+
+def sample_projects(cursor):
+    """Insert sample projects if the database is empty"""
+    cursor.execute('SELECT COUNT(*) FROM projects')
+    if cursor.fetchone()[0]:
+        return
+
+    projects = [
+        {
+            'title': 'E-commerce Website',
+            'description': 'Современный интернет-магазин с адаптивным дизайном',
+            'full_description': 'Полнофункциональный интернет-магазин, разработанный с использованием Flask и современного frontend стека. Включает корзину покупок, систему оплаты, админ-панель для управления товарами.',
+            'preview_image': '/static/images/project1-preview.jpg',
+            'live_url': 'https://example-shop.com'
+        },
+        {
+            'title': 'Blog Platform',
+            'description': 'Платформа для блогинга с системой комментариев',
+            'full_description': 'Современная блог-платформа с редактором Markdown, системой тегов, комментариями и авторизацией пользователей. Адаптивный дизайн и SEO-оптимизация.',
+            'preview_image': '/static/images/project2-preview.jpg',
+            'live_url': 'https://example-blog.com'
+        },
+        {
+            'title': 'Portfolio Dashboard',
+            'description': 'Интерактивная админ-панель для управления контентом',
+            'full_description': 'Профессиональная админ-панель с графиками, аналитикой, управлением пользователями и контентом. Реализована с использованием Chart.js и современных UI компонентов.',
+            'preview_image': '/static/images/project3-preview.jpg',
+            'live_url': 'https://example-dashboard.com'
+        }
+    ]
+
+    cursor.executemany('''
+        INSERT INTO projects (title, description, full_description, preview_image, live_url)
+        VALUES (:title, :description, :full_description, :preview_image, :live_url)
+    ''', projects)
+
+def _fold_yo(expression):
+    """SQL replacing "ё" with "е" in `expression`"""
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+def project_search(cursor):
+    """Full-text index over the project texts, kept in sync by triggers
+
+    unicode61 folds case for Cyrillic as well as Latin but keeps "ё" apart
+    from "е", so the index reads the texts through a view that replaces it
+    (search_match_expression() does the same to queries; snippets show the
+    replaced text). FTS5 has no
+    Russian stemmer; search_projects() matches words by prefix instead, and
+    the 2- and 3-letter prefix indexes keep short prefixes fast.
+    """
+    columns = ('title', 'description', 'full_description')
+    cursor.execute(f'''
+        CREATE VIEW projects_search_text AS
+        SELECT id, {', '.join(f'{_fold_yo(column)} AS {column}' for column in columns)}
+        FROM projects
+    ''')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE projects_fts USING fts5(
+            title, description, full_description,
+            content='projects_search_text', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    ''')
+    # ORDER BY rank: title matches weigh most, the long full description least
+    cursor.execute("INSERT INTO projects_fts (projects_fts, rank) VALUES ('rank', 'bm25(10.0, 4.0, 1.0)')")
+
+    # The index must be given exactly the values the view returns
+    new_values = ', '.join(_fold_yo(f'new.{column}') for column in columns)
+    old_values = ', '.join(_fold_yo(f'old.{column}') for column in columns)
+    insert = f"INSERT INTO projects_fts (rowid, {', '.join(columns)}) VALUES (new.id, {new_values});"
+    delete = f"INSERT INTO projects_fts (projects_fts, rowid, {', '.join(columns)}) VALUES ('delete', old.id, {old_values});"
+    cursor.execute(f'CREATE TRIGGER projects_fts_insert AFTER INSERT ON projects BEGIN {insert} END')
+    cursor.execute(f'CREATE TRIGGER projects_fts_delete AFTER DELETE ON projects BEGIN {delete} END')
+    # Preview and timestamp updates leave the index alone
+    cursor.execute(f'''
+        CREATE TRIGGER projects_fts_update AFTER UPDATE OF {', '.join(columns)} ON projects
+        BEGIN {delete} {insert} END
+    ''')
+    cursor.execute("INSERT INTO projects_fts (projects_fts) VALUES ('rebuild')")
+
+# Preview URLs of files in static/images, and the names storage.py gives
+# uploads (16 hex digits of the content hash, then e.g. "-640w.webp")
+UPLOAD_URL_PREFIX = '/static/images/'
+STORED_NAME_GLOB = '[0-9a-f]' * 16 + '*'
+
+def _file_refs(row):
+    """SQL selecting the stored files a projects row (new or old in a trigger) references"""
+    start = len(UPLOAD_URL_PREFIX) + 1
+    return f'''
+        SELECT name FROM (
+            SELECT substr({row}.preview_image, {start}) AS name
+            WHERE {row}.preview_image GLOB '{UPLOAD_URL_PREFIX}*'
+            UNION
+            SELECT substr(json_extract(value, '$.url'), {start})
+            FROM json_each({row}.preview_variants)
+            WHERE json_extract(value, '$.url') GLOB '{UPLOAD_URL_PREFIX}*'
+        ) WHERE name GLOB '{STORED_NAME_GLOB}'
+    '''
+
+def stored_files(cursor):
+    """Reference counts of uploaded files, kept by triggers on projects
+
+    A file counts one reference per project whose preview image or variants
+    use it. storage.sweep() deletes files whose count has been zero for a
+    grace period. Existing projects are counted when the table is created.
+    """
+    cursor.execute('''
+        CREATE TABLE stored_files (
+            name TEXT PRIMARY KEY,
+            size INTEGER,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            released_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_stored_files_unreferenced ON stored_files (released_at) WHERE refcount = 0')
+
+    retain = f'''
+        INSERT INTO stored_files (name, refcount) SELECT name, 1 FROM ({_file_refs('new')}) WHERE true
+        ON CONFLICT (name) DO UPDATE SET refcount = refcount + 1, released_at = NULL;
+    '''
+    release = f'''
+        UPDATE stored_files
+        SET refcount = max(refcount - 1, 0),
+            released_at = CASE WHEN refcount <= 1 THEN CURRENT_TIMESTAMP ELSE released_at END
+        WHERE name IN ({_file_refs('old')});
+    '''
+    cursor.execute(f'CREATE TRIGGER stored_files_insert AFTER INSERT ON projects BEGIN {retain} END')
+    cursor.execute(f'CREATE TRIGGER stored_files_delete AFTER DELETE ON projects BEGIN {release} END')
+    # Retained before released, so a file kept by the update never drops to zero
+    cursor.execute(f'''
+        CREATE TRIGGER stored_files_update AFTER UPDATE OF preview_image, preview_variants ON projects
+        WHEN old.preview_image IS NOT new.preview_image OR old.preview_variants IS NOT new.preview_variants
+        BEGIN {retain} {release} END
+    ''')
+
+    start = len(UPLOAD_URL_PREFIX) + 1
+    cursor.execute(f'''
+        INSERT INTO stored_files (name, refcount)
+        SELECT name, COUNT(*) FROM (
+            SELECT p.id, substr(p.preview_image, {start}) AS name FROM projects p
+            WHERE p.preview_image GLOB '{UPLOAD_URL_PREFIX}*'
+            UNION
+            SELECT p.id, substr(json_extract(v.value, '$.url'), {start}) FROM projects p, json_each(p.preview_variants) v
+            WHERE json_extract(v.value, '$.url') GLOB '{UPLOAD_URL_PREFIX}*'
+        )
+        WHERE name GLOB '{STORED_NAME_GLOB}'
+        GROUP BY name
+    ''')
+
+# Migration N brings the schema from user_version N-1 to N
+MIGRATIONS = (
+    initial_schema,
+    sample_projects,
+    project_search,
+    stored_files,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Data-only migrations that migrate(sample_data=False) marks as applied
+# without running, e.g. for databases filled by benchmark.py
+SAMPLE_DATA_MIGRATIONS = {sample_projects}
+
+def get_schema_version():
+    """The version of the database schema (0 for a new or unversioned database)"""
+    return get_db_connection().execute('PRAGMA user_version').fetchone()[0]
+
+@retry_on_busy
+def migrate(sample_data=True):
+    """Apply pending migrations; returns the number applied"""
+    conn = get_db_connection()
+
+    # These pragmas cannot run inside a transaction. auto_vacuum lets
+    # maintenance.py return freed pages to the OS a few at a time, but only
+    # takes effect before the first table is created.
+    if get_schema_version() == 0:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    # The journal mode is stored in the database file, so it only needs to be set once
+    conn.execute(f"PRAGMA journal_mode = {get_storage_settings()['journal_mode']}")
+
+    # The write lock is taken before reading the version, so concurrent
+    # callers (several services starting together) apply each step once
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cursor = conn.cursor()
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            if sample_data or migration not in SAMPLE_DATA_MIGRATIONS:
+                migration(cursor)
+            logger.info("Applied migration %d: %s", number, migration.__name__)
+        # PRAGMA statements cannot take parameters; SCHEMA_VERSION is an int
+        cursor.execute(f'PRAGMA user_version = {max(version, SCHEMA_VERSION)}')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return max(SCHEMA_VERSION - version, 0)
+
+def ensure_schema():
+    """Cheap check for process start: migrate only if the database is behind
+
+    Normally the migrations have already run from gunicorn's on_starting hook
+    or `python migrations.py`, and this is a single PRAGMA read.
+    """
+    if get_schema_version() < SCHEMA_VERSION:
+        migrate()
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+    if '--status' in sys.argv[1:]:
+        print(f"Schema version {get_schema_version()}, latest {SCHEMA_VERSION}")
+    else:
+        applied = migrate()
+        print(f"Applied {applied} migration(s), schema version {get_schema_version()}")
@@ -0,0 +1,166 @@
+"""
+Telegram admin notifications, delivered through the database outbox
+
+Web requests only queue a message (enqueue_notification); the dispatcher
+below sends queued messages with retries and exponential backoff. It runs
+inside the bot process (see bot.py) or standalone:
+
+    python notifications.py          # keep draining the outbox
+    python notifications.py --once   # send what is due and exit
+"""
+import json
+import logging
+import os
+import sys
+import threading
+from urllib import request as urlreq
+from urllib.error import HTTPError, URLError
+
+from database import (
+    enqueue_notification, claim_notifications,
+    mark_notification_sent, mark_notification_failed
+)
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Both required to send; the web app only queues messages and works without them
+BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+_admin_id = os.getenv('ADMIN_TELEGRAM_ID', '').strip()
+ADMIN_ID = int(_admin_id) if _admin_id.isascii() and _admin_id.isdigit() else None
+
+# Point this at a local stand-in server to test without api.telegram.org
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+
+SEND_TIMEOUT = 10
+BATCH_SIZE = 20
+POLL_INTERVAL = float(os.getenv('NOTIFY_POLL_INTERVAL', 1.0))
+
+# Retry schedule: 2, 4, 8, ... seconds, capped, then give up
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 2
+BACKOFF_MAX = 300
+
+def queue_access_request(token, ip_address, user_agent):
+    """Queue the approve/deny message for a new admin access request"""
+    message = (
+        f"🔐 Запрос доступа к админ-панели\n\n"
+        f"🌐 IP: {ip_address}\n"
+        f"🖥️ User Agent: {user_agent[:50]}...\n"
+        f"🔑 Session: {token[:8]}...\n\n"
+        f"Разрешить доступ?"
+    )
+
+    payload = {
+        "chat_id": ADMIN_ID,
+        "text": message,
+        "reply_markup": {
+            "inline_keyboard": [[
+                {"text": "✅ Разрешить", "callback_data": f"approve_{token}"},
+                {"text": "❌ Отклонить", "callback_data": f"deny_{token}"}
+            ]]
+        }
+    }
+    return enqueue_notification(payload)
+
+def require_settings():
+    """Fail with a clear message when the bot token or the admin's Telegram ID is not configured"""
+    if not BOT_TOKEN:
+        raise RuntimeError("TELEGRAM_BOT_TOKEN is not set (see .env.example)")
+    if not ADMIN_ID:
+        raise RuntimeError("ADMIN_TELEGRAM_ID is not set to a numeric Telegram user ID (see .env.example)")
+
+def send_message(payload):
+    """Send one message through the Telegram Bot API"""
+    require_settings()
+    req = urlreq.Request(
+        f"{TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendMessage",
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}
+    )
+    with metrics.timed('external_request_duration_seconds', service='telegram'):
+        with urlreq.urlopen(req, timeout=SEND_TIMEOUT) as response:
+            return json.loads(response.read() or b'{}')
+
+def _retry_delay(attempts, error):
+    """Seconds to wait before the next attempt, or None if it should not be retried"""
+    # Checked first so that sustained rate limiting also runs out of attempts
+    if attempts >= MAX_ATTEMPTS:
+        return None
+
+    if isinstance(error, HTTPError):
+        if error.code == 429:
+            # Telegram tells us exactly how long to back off
+            try:
+                return int(json.loads(error.read())['parameters']['retry_after'])
+            except (ValueError, KeyError, TypeError):
+                pass
+        elif 400 <= error.code < 500:
+            # Bad request, bad token, blocked chat: retrying will not help
+            return None
+
+    return min(BACKOFF_BASE ** attempts, BACKOFF_MAX)
+
+def drain_outbox(batch_size=BATCH_SIZE):
+    """Send due notifications; returns (sent, failed) counts"""
+    sent = failed = 0
+    while True:
+        batch = claim_notifications(batch_size)
+        if not batch:
+            return sent, failed
+
+        for notification in batch:
+            try:
+                send_message(notification['payload'])
+            except (URLError, OSError, ValueError) as e:
+                retry_in = _retry_delay(notification['attempts'], e)
+                mark_notification_failed(notification['id'], str(e), retry_in)
+                failed += 1
+                if retry_in is None:
+                    logger.error(f"Giving up on notification {notification['id']}: {e}")
+                else:
+                    logger.warning(f"Notification {notification['id']} failed, retrying in {retry_in}s: {e}")
+            else:
+                mark_notification_sent(notification['id'])
+                sent += 1
+
+        if len(batch) < batch_size:
+            return sent, failed
+
+def run_dispatcher(stop_event=None, interval=POLL_INTERVAL):
+    """Drain the outbox until `stop_event` is set"""
+    require_settings()
+    stop_event = stop_event or threading.Event()
+    logger.info("Notification dispatcher started")
+    while not stop_event.is_set():
+        try:
+            drain_outbox()
+        except Exception:
+            logger.exception("Notification dispatcher pass failed")
+        stop_event.wait(interval)
+
+def start_dispatcher_thread():
+    """Run the dispatcher in a daemon thread; returns the event that stops it"""
+    stop_event = threading.Event()
+    threading.Thread(target=run_dispatcher, args=(stop_event,), daemon=True, name='notification-dispatcher').start()
+    return stop_event
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    try:
+        require_settings()
+    except RuntimeError as e:
+        sys.exit(str(e))
+
+    from migrations import ensure_schema
+    ensure_schema()
+
+    if '--once' in sys.argv:
+        sent, failed = drain_outbox()
+        print(f"Sent: {sent}, failed: {failed}")
+    else:
+        run_dispatcher()
@@ -0,0 +1,76 @@
+"""
+Rendered page cache for the public site
+"""
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from database import get_content_version
+import compression
+
+# How often (seconds) each worker re-reads the content version from the
+# database. Within this window a cache hit does not touch SQLite at all.
+VERSION_CHECK_INTERVAL = float(os.getenv('PAGE_CACHE_VERSION_TTL', 1.0))
+
+# Upper bound on cached pages per worker; query strings are user controlled
+MAX_ENTRIES = 256
+
+_pages = {}
+_version = None
+_version_checked_at = 0.0
+_lock = threading.Lock()
+
+def current_version():
+    """Get the content version, re-reading it at most once per VERSION_CHECK_INTERVAL"""
+    global _version, _version_checked_at
+    now = time.monotonic()
+    if _version is None or now - _version_checked_at >= VERSION_CHECK_INTERVAL:
+        version = get_content_version()
+        with _lock:
+            if _version is None or version['version'] != _version['version']:
+                _pages.clear()
+            _version = version
+            _version_checked_at = now
+    return _version
+
+def parse_timestamp(value):
+    """Parse an SQLite CURRENT_TIMESTAMP value (UTC) into an aware datetime"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+def make_etag(body):
+    """Strong ETag value for a response body"""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return hashlib.sha256(body).hexdigest()[:32]
+
+def get_page(key, version):
+    """Get a cached page entry, or None if it is missing or stale"""
+    entry = _pages.get(key)
+    if entry and entry['version'] == version['version']:
+        return entry
+    return None
+
+def store_page(key, body, version):
+    """Cache a page body rendered from data read after `version` was taken"""
+    entry = {
+        'version': version['version'],
+        'body': body,
+        'etag': make_etag(body),
+        'last_modified': parse_timestamp(version['updated_at']),
+        # Compressed once per render instead of on every hit; at the dynamic
+        # level, as brotli's best quality takes ~1s on a large page
+        'encoded': compression.compress_all(body, best=False) if len(body) >= compression.MIN_SIZE else {},
+    }
+    with _lock:
+        if len(_pages) >= MAX_ENTRIES:
+            _pages.clear()
+        _pages[key] = entry
+    return entry
+
+def invalidate():
+    """Force the next lookup to re-read the content version (after a local mutation)"""
+    global _version_checked_at
+    _version_checked_at = 0.0
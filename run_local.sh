@@ -19,11 +19,9 @@ echo "Installing dependencies..."
 pip install -q --upgrade pip
 pip install -q -r requirements.txt
 
-# Initialize database if needed
-if [ ! -f "portfolio.db" ]; then
-    echo "Initializing database..."
-    python3 database.py
-fi
+# Create the database or apply new migrations
+echo "Migrating database..."
+python3 migrations.py
 
 # Run Flask development server
 echo ""
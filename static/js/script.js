@@ -2,7 +2,8 @@
 document.addEventListener('DOMContentLoaded', function() {
     const modal = document.getElementById('project-modal');
     const closeModal = document.querySelector('.close-modal');
-    const viewDetailsBtns = document.querySelectorAll('.view-details-btn');
+    const portfolioGrid = document.getElementById('portfolio-grid');
+    const cardTemplate = document.getElementById('portfolio-card-template');
 
     // Admin modal elements
     const adminModal = document.getElementById('admin-modal');
@@ -16,30 +17,33 @@ document.addEventListener('DOMContentLoaded', function() {
     const modalDescription = document.getElementById('modal-description');
     const modalLink = document.getElementById('modal-link');
     const modalImage = document.getElementById('modal-image');
+    const modalSources = {
+        'image/avif': document.getElementById('modal-source-avif'),
+        'image/webp': document.getElementById('modal-source-webp')
+    };
     const modalImageContainer = document.getElementById('modal-image-container');
 
-    // Open modal when clicking on "Подробнее" button
-    viewDetailsBtns.forEach(btn => {
-        btn.addEventListener('click', function(e) {
-            e.preventDefault();
-            e.stopPropagation();
-            const projectId = this.getAttribute('data-project-id');
-            openModal(projectId);
-        });
-    });
-
-    // Open modal when clicking on card (but not on buttons)
-    const portfolioCards = document.querySelectorAll('.portfolio-card');
-    portfolioCards.forEach(card => {
-        card.addEventListener('click', function(e) {
-            // Don't open modal if clicking on buttons or links
-            if (e.target.tagName === 'BUTTON' || e.target.tagName === 'A' || e.target.closest('button') || e.target.closest('a')) {
+    // Open modal when clicking on a card or its "Подробнее" button; one
+    // listener on the grid also covers cards loaded later
+    if (portfolioGrid) {
+        portfolioGrid.addEventListener('click', function(e) {
+            const btn = e.target.closest('.view-details-btn');
+            if (btn) {
+                e.preventDefault();
+                e.stopPropagation();
+                openModal(btn.getAttribute('data-project-id'));
                 return;
             }
-            const projectId = this.getAttribute('data-project-id');
-            openModal(projectId);
+            // Don't open modal if clicking on other buttons or links
+            if (e.target.closest('button') || e.target.closest('a')) {
+                return;
+            }
+            const card = e.target.closest('.portfolio-card');
+            if (card) {
+                openModal(card.getAttribute('data-project-id'));
+            }
         });
-    });
+    }
 
     // Close modal events
     closeModal.addEventListener('click', function() {
@@ -81,8 +85,16 @@ document.addEventListener('DOMContentLoaded', function() {
 
                 // Set image if available
                 if (data.preview_image) {
+                    setModalImageSources(data.preview_variants || []);
                     modalImage.src = data.preview_image;
                     modalImage.alt = data.title;
+                    if (data.preview_width) {
+                        modalImage.width = data.preview_width;
+                        modalImage.height = data.preview_height;
+                    } else {
+                        modalImage.removeAttribute('width');
+                        modalImage.removeAttribute('height');
+                    }
                     modalImageContainer.style.display = 'block';
                 } else {
                     modalImageContainer.style.display = 'none';
@@ -111,6 +123,21 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
+    // Fill the modal <picture> sources with the responsive variants of a project
+    function setModalImageSources(variants) {
+        Object.entries(modalSources).forEach(([type, source]) => {
+            const srcset = variants
+                .filter(variant => variant.type === type)
+                .map(variant => `${variant.url} ${variant.width}w`)
+                .join(', ');
+            if (srcset) {
+                source.srcset = srcset;
+            } else {
+                source.removeAttribute('srcset');
+            }
+        });
+    }
+
     // Admin modal functionality
     if (adminBtn) {
         adminBtn.addEventListener('click', function() {
@@ -144,7 +171,9 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    let authCheckInterval = null;
+    // Long-poll wait (seconds) for /api/check_auth; the server caps it
+    const AUTH_CHECK_WAIT = 25;
+    let authCheckController = null;
 
     if (requestAccessBtn) {
         requestAccessBtn.addEventListener('click', function() {
@@ -174,50 +203,69 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function startAuthCheck(token) {
-        // Check status every 2 seconds
-        authCheckInterval = setInterval(() => {
-            fetch(`/api/check_auth/${token}`)
-                .then(response => response.json())
-                .then(data => {
-                    if (data.status === 'approved') {
-                        // Success! Redirect to admin panel
-                        clearInterval(authCheckInterval);
-                        window.location.href = `/admin/login?token=${token}&auto=1`;
-                    } else if (data.status === 'rejected') {
-                        // Rejected by admin
-                        clearInterval(authCheckInterval);
-                        adminModal.style.display = 'none';
-                        resetAdminModalToInitial();
-
-                        const currentLang = window.currentLang || 'en';
-                        const message = currentLang === 'ru'
-                            ? 'Администратор отклонил запрос на доступ'
-                            : 'Admin rejected the access request';
-                        showNotification(message, 'error');
-                    } else if (data.status === 'invalid') {
-                        // Invalid token
-                        clearInterval(authCheckInterval);
-                        resetAdminModalToInitial();
-
-                        const currentLang = window.currentLang || 'en';
-                        const message = currentLang === 'ru'
-                            ? 'Сессия истекла'
-                            : 'Session expired';
-                        showNotification(message, 'error');
+        stopAuthCheck();
+        authCheckController = new AbortController();
+        pollAuthStatus(token, authCheckController);
+    }
+
+    function stopAuthCheck() {
+        if (authCheckController) {
+            authCheckController.abort();
+            authCheckController = null;
+        }
+    }
+
+    function pollAuthStatus(token, controller) {
+        // The server holds the request open until the admin answers or the wait runs out
+        fetch(`/api/check_auth/${token}?wait=${AUTH_CHECK_WAIT}`, { signal: controller.signal })
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'approved') {
+                    // Success! Redirect to admin panel
+                    stopAuthCheck();
+                    window.location.href = `/admin/login?token=${token}&auto=1`;
+                } else if (data.status === 'rejected') {
+                    // Rejected by admin
+                    stopAuthCheck();
+                    adminModal.style.display = 'none';
+                    resetAdminModalToInitial();
+
+                    const currentLang = window.currentLang || 'en';
+                    const message = currentLang === 'ru'
+                        ? 'Администратор отклонил запрос на доступ'
+                        : 'Admin rejected the access request';
+                    showNotification(message, 'error');
+                } else if (data.status === 'invalid') {
+                    // Invalid token
+                    stopAuthCheck();
+                    resetAdminModalToInitial();
+
+                    const currentLang = window.currentLang || 'en';
+                    const message = currentLang === 'ru'
+                        ? 'Сессия истекла'
+                        : 'Session expired';
+                    showNotification(message, 'error');
+                } else if (!controller.signal.aborted) {
+                    // Still pending, wait again
+                    pollAuthStatus(token, controller);
+                }
+            })
+            .catch(error => {
+                if (controller.signal.aborted) {
+                    return;
+                }
+                console.error('Error checking auth status:', error);
+                // Back off before retrying after a network error
+                setTimeout(() => {
+                    if (!controller.signal.aborted) {
+                        pollAuthStatus(token, controller);
                     }
-                    // else status is 'pending', keep waiting
-                })
-                .catch(error => {
-                    console.error('Error checking auth status:', error);
-                });
-        }, 2000);
+                }, 2000);
+            });
     }
 
     function resetAdminModal() {
-        if (authCheckInterval) {
-            clearInterval(authCheckInterval);
-            authCheckInterval = null;
-        }
+        stopAuthCheck();
         resetAdminModalToInitial();
     }
 
@@ -278,20 +326,22 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Add loading animation for images
-    const images = document.querySelectorAll('img');
-    images.forEach(img => {
-        img.addEventListener('load', function() {
-            this.style.opacity = '1';
-        });
-
-        // Handle broken images
-        img.addEventListener('error', function() {
-            this.style.background = '#2a2a2a';
-            this.style.border = '2px dashed #555';
-            this.alt = 'Изображение недоступно';
-        });
-    });
+    // Add loading animation for images (load and error don't bubble, so
+    // listen in the capture phase to cover images added later as well)
+    document.addEventListener('load', function(e) {
+        if (e.target.tagName === 'IMG') {
+            e.target.style.opacity = '1';
+        }
+    }, true);
+
+    // Handle broken images
+    document.addEventListener('error', function(e) {
+        if (e.target.tagName === 'IMG') {
+            e.target.style.background = '#2a2a2a';
+            e.target.style.border = '2px dashed #555';
+            e.target.alt = 'Изображение недоступно';
+        }
+    }, true);
 
     // Add parallax effect to hero section
     window.addEventListener('scroll', function() {
@@ -319,18 +369,22 @@ document.addEventListener('DOMContentLoaded', function() {
     }, observerOptions);
 
     // Initially hide cards and observe them
-    portfolioCards.forEach((card, index) => {
-        card.style.opacity = '0';
-        card.style.transform = 'translateY(30px)';
-        card.style.transition = `all 0.6s ease ${index * 0.1}s`;
-        observer.observe(card);
-    });
+    function revealCards(cards) {
+        cards.forEach((card, index) => {
+            card.style.opacity = '0';
+            card.style.transform = 'translateY(30px)';
+            card.style.transition = `all 0.6s ease ${index * 0.1}s`;
+            observer.observe(card);
+        });
+    }
+
+    revealCards(document.querySelectorAll('.portfolio-card'));
 
     // Create tag copies for continuous scrolling
-    function createTagCopies() {
-        const cardTags = document.querySelectorAll('.card-tags');
+    function createTagCopies(root = document) {
+        const cardTags = root.querySelectorAll('.card-tags');
         cardTags.forEach(tagsContainer => {
-            const tags = tagsContainer.querySelectorAll('.tag-badge');
+            const tags = tagsContainer.querySelectorAll('.tag-badge:not(.tag-badge-copy)');
             if (tags.length > 0) {
                 // Clear any existing copies
                 const existingCopies = tagsContainer.querySelectorAll('.tag-badge-copy');
@@ -348,5 +402,115 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Create copies on page load and resize
     createTagCopies();
-    window.addEventListener('resize', createTagCopies);
+    window.addEventListener('resize', () => createTagCopies());
+
+    // Infinite scroll: the next page of cards comes from /api/projects when
+    // the "Показать еще" block gets close to the viewport
+    const loadMore = document.getElementById('portfolio-more');
+    let loadingMore = false;
+
+    function buildCard(project) {
+        const card = cardTemplate.content.firstElementChild.cloneNode(true);
+        card.setAttribute('data-project-id', project.id);
+
+        const picture = card.querySelector('picture');
+        const img = picture.querySelector('img');
+        const types = [...new Set(project.preview_variants.map(variant => variant.type))];
+        types.forEach(type => {
+            const source = document.createElement('source');
+            source.type = type;
+            source.sizes = '(max-width: 768px) 100vw, 400px';
+            source.srcset = project.preview_variants
+                .filter(variant => variant.type === type)
+                .map(variant => `${variant.url} ${variant.width}w`)
+                .join(', ');
+            picture.insertBefore(source, img);
+        });
+        img.src = project.preview_image;
+        img.alt = project.title;
+        if (project.preview_width) {
+            img.width = project.preview_width;
+            img.height = project.preview_height;
+        }
+
+        card.querySelector('h3').textContent = project.title;
+        card.querySelector('.card-content p').textContent = project.description;
+
+        const tagsScroll = card.querySelector('.card-tags-scroll');
+        if (project.tags.length) {
+            // Tags are rendered twice for the scrolling animation, as in index.html
+            [...project.tags, ...project.tags].forEach(tag => {
+                const badge = document.createElement('span');
+                badge.className = 'tag-badge';
+                badge.textContent = tag.name;
+                tagsScroll.appendChild(badge);
+            });
+        } else {
+            card.querySelector('.card-tags').remove();
+        }
+
+        card.querySelector('.view-details-btn').setAttribute('data-project-id', project.id);
+        return card;
+    }
+
+    function loadMoreProjects() {
+        if (loadingMore || !loadMore) {
+            return;
+        }
+        loadingMore = true;
+
+        const params = new URLSearchParams({ cursor: loadMore.dataset.nextCursor });
+        if (portfolioGrid.dataset.tags) {
+            params.set('tags', portfolioGrid.dataset.tags);
+            params.set('mode', portfolioGrid.dataset.mode);
+        }
+
+        fetch(`/api/projects?${params}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Failed to load projects');
+                }
+                return response.json();
+            })
+            .then(data => {
+                const cards = data.projects.map(buildCard);
+                cards.forEach(card => portfolioGrid.appendChild(card));
+                revealCards(cards);
+                cards.forEach(card => createTagCopies(card));
+
+                if (data.next_cursor) {
+                    loadMore.dataset.nextCursor = data.next_cursor;
+                    const link = loadMore.querySelector('.load-more');
+                    const url = new URL(link.href);
+                    url.searchParams.set('cursor', data.next_cursor);
+                    link.href = url;
+                    // Observe again: the block may still be in view after a short page
+                    moreObserver.unobserve(loadMore);
+                    moreObserver.observe(loadMore);
+                } else {
+                    moreObserver.disconnect();
+                    loadMore.remove();
+                }
+            })
+            .catch(error => {
+                console.error('Error loading projects:', error);
+            })
+            .finally(() => {
+                loadingMore = false;
+            });
+    }
+
+    const moreObserver = new IntersectionObserver(function(entries) {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadMoreProjects();
+        }
+    }, { rootMargin: '0px 0px 600px 0px' });
+
+    if (loadMore && cardTemplate) {
+        moreObserver.observe(loadMore);
+        loadMore.querySelector('.load-more').addEventListener('click', function(e) {
+            e.preventDefault();
+            loadMoreProjects();
+        });
+    }
 });
\ No newline at end of file
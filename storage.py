@@ -0,0 +1,191 @@
+"""
+Content-addressed storage for uploaded images
+
+Multipart image uploads are streamed to a temporary file in the upload folder
+in chunks and hashed while they are written, so a large image is never held
+in memory and never read twice. The file is then moved to its content name
+(`<sha256[:16]>.<ext>`); uploading the same image again reuses the file.
+
+The stored_files table counts how many projects reference each file (kept by
+triggers on projects, see migrations.py). Files nothing has referenced for
+STORAGE_GRACE_PERIOD seconds are removed by the sweeper, which runs with the
+maintenance passes (see maintenance.py) or standalone:
+
+    python storage.py sweep             # remove unreferenced files
+    python storage.py sweep --dry-run   # only list them
+"""
+import hashlib
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+
+from flask import Request, current_app
+from database import (
+    delete_stored_file, get_stored_file_names, get_unreferenced_files, register_stored_file
+)
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_FOLDER = 'static/images'
+CHUNK_SIZE = 64 * 1024
+
+def grace_period():
+    """Seconds an unreferenced file is kept (STORAGE_GRACE_PERIOD, default an hour)
+
+    Covers a form that saved the file but has not saved the project yet, and
+    pages still cached with the old URL.
+    """
+    return int(os.getenv('STORAGE_GRACE_PERIOD', 3600))
+
+TEMP_PREFIX = '.upload-'
+
+# Uploads and their resized variants from images.py; nothing else in the
+# upload folder (placeholder, older timestamped uploads) is ever swept
+STORED_NAME = re.compile(r'^[0-9a-f]{16}(-\d+w)?\.[a-z0-9]+$')
+
+class HashingFile:
+    """Temporary file in the upload folder that hashes what is written to it"""
+
+    def __init__(self, folder):
+        self.file = tempfile.NamedTemporaryFile(dir=folder, prefix=TEMP_PREFIX, delete=False)
+        # NamedTemporaryFile is private to the owner; stored files are served
+        os.chmod(self.file.name, 0o644)
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def close(self):
+        """Close the file and remove it unless it was stored"""
+        self.file.close()
+        try:
+            os.remove(self.file.name)
+        except FileNotFoundError:
+            pass
+
+class UploadRequest(Request):
+    """Request that streams the files uploaded to UPLOAD_ENDPOINTS through HashingFile
+
+    Uploads to other views (e.g. a bulk import file) are not meant to be
+    stored and get Werkzeug's usual temporary file.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint not in current_app.config.get('UPLOAD_ENDPOINTS', ()):
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return HashingFile(current_app.config.get('UPLOAD_FOLDER', UPLOAD_FOLDER))
+
+def _extension(filename):
+    # secure_filename() would drop the dot of a non-ASCII name like "Фото.jpg"
+    extension = os.path.splitext(filename or '')[1].lower()
+    return extension if re.fullmatch(r'\.[a-z0-9]+', extension) else ''
+
+def store_upload(file, folder=UPLOAD_FOLDER):
+    """Store an uploaded FileStorage under its content hash and return the file name"""
+    stream = file.stream
+    if not isinstance(stream, HashingFile):
+        # Not parsed by UploadRequest: copy it through a HashingFile
+        stream = HashingFile(folder)
+        for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+            stream.write(chunk)
+    stream.flush()
+
+    filename = f"{stream.digest.hexdigest()[:16]}{_extension(file.filename)}"
+    file_path = os.path.join(folder, filename)
+
+    def place():
+        # Same content, same name: a re-upload does not need to be written again
+        if not os.path.exists(file_path):
+            os.replace(stream.name, file_path)
+
+    try:
+        register_stored_file(filename, stream.size, place)
+    finally:
+        if stream is not file.stream:
+            stream.close()
+    return filename
+
+def _remove(folder):
+    def remove(name):
+        try:
+            os.remove(os.path.join(folder, name))
+        except FileNotFoundError:
+            pass
+    return remove
+
+def sweep(folder=UPLOAD_FOLDER, grace=None, dry_run=False):
+    """Remove stored files nothing references and stale temporary files
+
+    Returns the names removed (or that would be removed with `dry_run`).
+    """
+    if grace is None:
+        grace = grace_period()
+    remove = (lambda name: None) if dry_run else _remove(folder)
+    removed = []
+    while True:
+        names = get_unreferenced_files(grace)
+        if dry_run:
+            removed.extend(names)
+            break
+        batch = [name for name in names if delete_stored_file(name, grace, remove)]
+        removed.extend(batch)
+        if not batch:
+            break
+
+    # Files on disk without a row: variants of an image job whose project got
+    # another image meanwhile, or files written before stored_files existed
+    known = get_stored_file_names()
+    cutoff = time.time() - grace
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime > cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            if entry.name.startswith(TEMP_PREFIX):
+                if not dry_run:
+                    remove(entry.name)
+                removed.append(entry.name)
+            elif STORED_NAME.match(entry.name) and entry.name not in known:
+                if dry_run or delete_stored_file(entry.name, grace, remove):
+                    removed.append(entry.name)
+
+    if removed:
+        logger.info(f"Swept {len(removed)} unreferenced file(s) from {folder}")
+    return removed
+
+def init_app(app):
+    """Stream uploads to the views in UPLOAD_ENDPOINTS of `app` through the content-addressed storage"""
+    app.request_class = UploadRequest
+    app.config.setdefault('UPLOAD_ENDPOINTS', set())
+    os.makedirs(app.config.setdefault('UPLOAD_FOLDER', UPLOAD_FOLDER), exist_ok=True)
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    if sys.argv[1:2] != ['sweep']:
+        print("Usage: python storage.py sweep [--dry-run]")
+        sys.exit(1)
+
+    from migrations import ensure_schema
+    ensure_schema()
+
+    dry_run = '--dry-run' in sys.argv
+    for name in sweep(dry_run=dry_run):
+        print(f"{'Would remove' if dry_run else 'Removed'} {name}")
@@ -0,0 +1,130 @@
+"""
+In-memory tag index for filtering the portfolio grid
+
+Every tag maps to a bitset (a Python int) of the projects that have it, where
+bit i is the i-th project in grid order (newest first). Filtering by several
+tags is a few integer AND/OR operations, facet counts are popcounts, and a
+page is read off the set bits in order, so the grid never joins project_tags
+in SQLite.
+
+The index is built from project_tags once per content version: an admin
+mutation bumps the version and the next request in each worker rebuilds it.
+"""
+import threading
+from database import get_all_tags, get_project_keys, get_project_tag_pairs
+
+# Tags a filter may combine; the selection comes from the query string
+MAX_SELECTED_TAGS = 20
+
+MODES = ('and', 'or')
+
+_index = None
+_lock = threading.Lock()
+
+if hasattr(int, 'bit_count'):
+    _popcount = int.bit_count
+else:  # Python < 3.10
+    def _popcount(bits):
+        return bin(bits).count('1')
+
+class TagIndex:
+    """Project bitsets per tag for one content version"""
+
+    def __init__(self, version, keys, tags, pairs):
+        self.version = version
+        self.keys = keys  # (created_at, id) per position, newest first
+        self.tags = tags
+        self.all = (1 << len(keys)) - 1
+
+        position = {key[1]: i for i, key in enumerate(keys)}
+        # Setting bits in a bytearray and converting once per tag is linear;
+        # OR-ing into a growing int would copy it for every pair
+        bitmaps = {}
+        for project_id, tag_id in pairs:
+            bitmap = bitmaps.get(tag_id)
+            if bitmap is None:
+                bitmap = bitmaps[tag_id] = bytearray((len(keys) + 7) // 8)
+            i = position.get(project_id)
+            if i is None:  # tagged after the keys were read
+                continue
+            bitmap[i >> 3] |= 1 << (i & 7)
+        self.bits = {tag_id: int.from_bytes(bitmap, 'little') for tag_id, bitmap in bitmaps.items()}
+
+    def match(self, selection, mode='and'):
+        """Bitset of the projects with all (mode 'and') or any (mode 'or') of the selected tags"""
+        if not selection:
+            return self.all
+        if mode == 'or':
+            bits = 0
+            for tag_id in selection:
+                bits |= self.bits.get(tag_id, 0)
+            return bits
+        bits = self.all
+        for tag_id in selection:
+            bits &= self.bits.get(tag_id, 0)
+        return bits
+
+    def facets(self, bits):
+        """Number of projects in `bits` with each tag"""
+        return {tag['id']: _popcount(bits & self.bits.get(tag['id'], 0)) for tag in self.tags}
+
+    def count(self, bits):
+        """Number of projects in `bits`"""
+        return _popcount(bits)
+
+    def _start(self, after):
+        # First position past the (created_at, id) key `after`; keys descend
+        low, high = 0, len(self.keys)
+        while low < high:
+            middle = (low + high) // 2
+            if self.keys[middle] >= after:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def page(self, bits, limit, after=None):
+        """Project ids of one page of `bits` and the key of its last project (None on the last page)
+
+        Same keyset semantics as database.get_project_cards: `after` is the
+        (created_at, id) of the last project of the previous page.
+        """
+        position = self._start(tuple(after)) if after else 0
+        remaining = bits >> position
+        # One extra position tells whether there is a next page
+        positions = []
+        while remaining and len(positions) <= limit:
+            lowest = (remaining & -remaining).bit_length() - 1
+            position += lowest
+            positions.append(position)
+            remaining >>= lowest + 1
+            position += 1
+
+        next_key = self.keys[positions[limit - 1]] if len(positions) > limit else None
+        return [self.keys[i][1] for i in positions[:limit]], next_key
+
+def get_index(version):
+    """Tag index for a content version from page_cache.current_version(), built on first use"""
+    global _index
+    index = _index
+    if index is None or index.version != version['version']:
+        with _lock:
+            if _index is None or _index.version != version['version']:
+                # Read after the version was taken, like the page cache
+                _index = TagIndex(version['version'], get_project_keys(), get_all_tags(), get_project_tag_pairs())
+            index = _index
+    return index
+
+def parse_selection(args):
+    """Selected tag ids and mode from ?tags=1,2&mode=or (or the older ?tag=1)"""
+    selection = set()
+    for value in args.get('tags', '').split(','):
+        value = value.strip()
+        # isdigit() alone also accepts e.g. '²', which int() rejects
+        if value.isascii() and value.isdigit():
+            selection.add(int(value))
+    tag_id = args.get('tag', type=int)
+    if tag_id:
+        selection.add(tag_id)
+    mode = args.get('mode')
+    return tuple(sorted(selection)[:MAX_SELECTED_TAGS]), mode if mode in MODES else 'and'
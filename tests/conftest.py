@@ -0,0 +1,26 @@
+"""
+Test setup: a scratch database and metrics directory for the whole run
+
+The paths are set before any project module is imported, since they are
+read at import time; a developer's .env does not override them.
+"""
+import os
+import tempfile
+import pytest
+
+_scratch = tempfile.mkdtemp(prefix='portfolio-tests-')
+os.environ['DATABASE_PATH'] = os.path.join(_scratch, 'portfolio.db')
+os.environ['METRICS_DIR'] = os.path.join(_scratch, 'metrics')
+os.environ['AUTH_SIGNAL_PATH'] = os.path.join(_scratch, 'auth-signal')
+os.environ['EXPORT_DIR'] = ''
+
+@pytest.fixture(scope='session')
+def app():
+    """The Flask app, on a database migrated with the sample projects"""
+    from app import app
+    app.config['TESTING'] = True
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
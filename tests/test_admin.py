@@ -0,0 +1,50 @@
+import io
+import pytest
+import database
+
+@pytest.fixture
+def admin(client):
+    """The test client, logged in to the admin panel"""
+    if not database.get_auth_session('test-admin'):
+        database.create_auth_session('test-admin', 1, 'admin')
+        database.approve_auth_session('test-admin')
+    with client.session_transaction() as session:
+        session['admin_token'] = 'test-admin'
+    return client
+
+def _save(admin, project_id, **fields):
+    data = {'action': 'save', 'project_id': str(project_id), 'title': 'Проект', 'description': '', 'full_description': ''}
+    return admin.post('/admin', data=dict(data, **fields), content_type='multipart/form-data')
+
+def _with_variants(project_id):
+    database.set_project_preview(project_id, '/static/images/old-960w.webp', 960, 540,
+                                 [{'url': '/static/images/old-960w.webp', 'width': 960}])
+
+def test_new_preview_replaces_variants_in_one_write(admin, app, tmp_path):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    project_id = database.add_project('Проект', '', '', '/static/images/old.jpg', None)
+    _with_variants(project_id)
+    # The content version writes of a save without an upload
+    version = database.get_content_version()['version']
+    assert _save(admin, project_id).status_code == 302
+    writes = database.get_content_version()['version'] - version
+
+    version = database.get_content_version()['version']
+    try:
+        assert _save(admin, project_id, preview_image=(io.BytesIO(b'new image'), 'new.png')).status_code == 302
+    finally:
+        app.config['UPLOAD_FOLDER'] = 'static/images'
+
+    project = database.get_project_by_id(project_id)
+    assert project['preview_image'].endswith('.png')
+    assert (project['preview_width'], project['preview_height'], project['preview_variants']) == (None, None, [])
+    assert database.get_content_version()['version'] - version == writes
+
+def test_edit_without_upload_keeps_variants(admin):
+    project_id = database.add_project('Проект', '', '', '/static/images/old.jpg', None)
+    _with_variants(project_id)
+
+    assert _save(admin, project_id, title='Новое').status_code == 302
+
+    project = database.get_project_by_id(project_id)
+    assert (project['title'], project['preview_width'], project['preview_variants']) == ('Новое', 960, [{'url': '/static/images/old-960w.webp', 'width': 960}])
@@ -0,0 +1,29 @@
+import builtins
+import os
+import critical_css
+
+def test_cached_render_reads_no_files(app, client, monkeypatch):
+    assert client.get('/').status_code == 200
+
+    def no_open(*args, **kwargs):
+        raise AssertionError(f'file opened while rendering: {args[0]}')
+    monkeypatch.setattr(builtins, 'open', no_open)
+    with app.test_request_context('/'):
+        assert critical_css.critical_css('index.html')
+
+def test_debug_mode_picks_up_changes(app, tmp_path, monkeypatch):
+    stylesheet = tmp_path / critical_css.STYLESHEET
+    stylesheet.parent.mkdir()
+    stylesheet.write_text('body{color:red}.later{color:blue}', encoding='utf-8')
+    script = tmp_path / critical_css.SCRIPT
+    script.parent.mkdir()
+    script.write_text('', encoding='utf-8')
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    monkeypatch.setattr(app, 'debug', True)
+
+    with app.test_request_context('/'):
+        assert 'color:red' in critical_css.critical_css('index.html')
+        stylesheet.write_text('body{color:green}', encoding='utf-8')
+        stat = stylesheet.stat()
+        os.utime(stylesheet, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert 'color:green' in critical_css.critical_css('index.html')
@@ -0,0 +1,36 @@
+import sys
+import pytest
+import database
+import metrics
+
+@pytest.fixture
+def metrics_token(app, monkeypatch):
+    monkeypatch.setattr(sys.modules['app'], 'METRICS_TOKEN', 'secret')
+
+def test_metrics_token(client, metrics_token):
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert b'# TYPE db_query_duration_seconds histogram' in response.data
+
+@pytest.mark.parametrize('authorization', ['', 'Bearer wrong', 'Bearer é'])
+def test_metrics_forbidden(client, metrics_token, authorization):
+    assert client.get('/metrics', headers={'Authorization': authorization}).status_code == 403
+
+@pytest.fixture
+def queries(app):
+    """Function labels of the statements run while the fixture is active"""
+    labels = []
+    database.set_query_observer(lambda function, seconds, fetch: labels.append(function))
+    yield labels
+    database.set_query_observer(metrics._record_query)
+
+@pytest.mark.parametrize('call, label', [
+    (lambda: database.get_project_cards(12), 'get_project_cards'),
+    (lambda: database.search_projects('проект'), 'search_projects'),
+    (lambda: database.add_tag('Метрики'), 'add_tag'),
+    (lambda: list(database.iter_projects()), 'iter_projects'),
+    (lambda: database.write_projects([]), 'write_projects'),
+])
+def test_queries_labelled_with_public_function(queries, call, label):
+    call()
+    assert queries and set(queries) == {label}
@@ -0,0 +1,110 @@
+"""The notification dispatcher against a local stand-in for the Telegram Bot API"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import database
+import notifications
+
+class _TelegramStub(BaseHTTPRequestHandler):
+    """Answers with the queued (status, body) responses, then with success"""
+
+    def do_POST(self):
+        server = self.server
+        server.requests.append((self.path, json.loads(self.rfile.read(int(self.headers['Content-Length'])))))
+        status, body = server.responses.pop(0) if server.responses else (200, {'ok': True, 'result': {}})
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def telegram(app, monkeypatch):
+    """Stub server the dispatcher sends to, with an empty outbox"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _TelegramStub)
+    server.requests, server.responses = [], []
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    monkeypatch.setattr(notifications, 'TELEGRAM_API_URL', f'http://127.0.0.1:{server.server_port}')
+    monkeypatch.setattr(notifications, 'BOT_TOKEN', '0:test')
+    monkeypatch.setattr(notifications, 'ADMIN_ID', 1)
+    conn = database.get_db_connection()
+    conn.execute('DELETE FROM notification_outbox')
+    conn.commit()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _outbox(notification_id):
+    """The row, with the seconds until its next attempt"""
+    row = database.get_db_connection().execute('''
+        SELECT *, CAST(round((julianday(next_attempt_at) - julianday('now')) * 86400) AS INTEGER) AS retry_in
+        FROM notification_outbox WHERE id = ?
+    ''', (notification_id,)).fetchone()
+    return dict(row)
+
+def _make_due(notification_id):
+    conn = database.get_db_connection()
+    conn.execute("UPDATE notification_outbox SET next_attempt_at = datetime('now', '-1 seconds') WHERE id = ?", (notification_id,))
+    conn.commit()
+
+def test_send(telegram):
+    notification_id = notifications.queue_access_request('a' * 32, '127.0.0.1', 'pytest')
+    assert notifications.drain_outbox() == (1, 0)
+
+    [(path, payload)] = telegram.requests
+    assert path == '/bot0:test/sendMessage'
+    assert payload['chat_id'] == 1
+    assert payload['reply_markup']['inline_keyboard'][0][0]['callback_data'] == 'approve_' + 'a' * 32
+    assert _outbox(notification_id)['status'] == 'sent'
+
+def test_rate_limited_waits_retry_after(telegram):
+    telegram.responses.append((429, {'ok': False, 'parameters': {'retry_after': 37}}))
+    notification_id = database.enqueue_notification({'chat_id': 1, 'text': 'x'})
+    assert notifications.drain_outbox() == (0, 1)
+
+    row = _outbox(notification_id)
+    assert (row['status'], row['attempts']) == ('pending', 1)
+    assert abs(row['retry_in'] - 37) <= 1
+
+def test_server_error_backs_off(telegram):
+    notification_id = database.enqueue_notification({'chat_id': 1, 'text': 'x'})
+    for attempt in (1, 2, 3):
+        telegram.responses.append((502, {'ok': False}))
+        assert notifications.drain_outbox() == (0, 1)
+        row = _outbox(notification_id)
+        assert (row['status'], row['attempts']) == ('pending', attempt)
+        assert abs(row['retry_in'] - notifications.BACKOFF_BASE ** attempt) <= 1
+        _make_due(notification_id)
+
+    assert notifications.drain_outbox() == (1, 0)
+    assert _outbox(notification_id)['status'] == 'sent'
+
+def test_client_error_gives_up(telegram):
+    telegram.responses.append((400, {'ok': False, 'description': 'Bad Request: chat not found'}))
+    notification_id = database.enqueue_notification({'chat_id': 1, 'text': 'x'})
+    assert notifications.drain_outbox() == (0, 1)
+    assert (_outbox(notification_id)['status'], _outbox(notification_id)['attempts']) == ('failed', 1)
+
+def test_gives_up_after_max_attempts(telegram):
+    # Sustained rate limiting counts toward MAX_ATTEMPTS like any other failure
+    telegram.responses.extend([(429, {'ok': False, 'parameters': {'retry_after': 1}})] * (notifications.MAX_ATTEMPTS + 1))
+    notification_id = database.enqueue_notification({'chat_id': 1, 'text': 'x'})
+    for _ in range(notifications.MAX_ATTEMPTS):
+        notifications.drain_outbox()
+        _make_due(notification_id)
+
+    row = _outbox(notification_id)
+    assert (row['status'], row['attempts']) == ('failed', notifications.MAX_ATTEMPTS)
+    assert len(telegram.requests) == notifications.MAX_ATTEMPTS
+    assert notifications.drain_outbox() == (0, 0)
+
+@pytest.mark.parametrize('setting', ['BOT_TOKEN', 'ADMIN_ID'])
+def test_settings_required(telegram, monkeypatch, setting):
+    monkeypatch.setattr(notifications, setting, None)
+    with pytest.raises(RuntimeError, match='TELEGRAM_BOT_TOKEN' if setting == 'BOT_TOKEN' else 'ADMIN_TELEGRAM_ID'):
+        notifications.run_dispatcher()
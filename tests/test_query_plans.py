@@ -0,0 +1,31 @@
+"""Every query in database.py uses an index (see check_query_plans.py)"""
+import pytest
+import check_query_plans
+import database
+
+# The calls only bind their arguments, so the labels can be listed up front
+LABELS = [label for label, _, _ in check_query_plans.query_calls([0, 0], [0])]
+
+@pytest.fixture(scope='module')
+def calls(app, tmp_path_factory):
+    """The query calls, run in order against a scratch database of their own
+
+    Takes `app` so that importing it migrates the shared test database first.
+    """
+    database.close_db_connections()
+    path = database.DATABASE_PATH
+    database.DATABASE_PATH = str(tmp_path_factory.mktemp('plans') / 'plan-check.db')
+    try:
+        yield {label: func for label, _, func in check_query_plans.query_calls(*check_query_plans.seed())}
+    finally:
+        database.close_db_connections()
+        database.DATABASE_PATH = path
+
+def test_every_function_is_checked():
+    calls = check_query_plans.query_calls([0, 0], [0])
+    assert check_query_plans.uncovered_functions(calls) == []
+
+@pytest.mark.parametrize('label', LABELS)
+def test_query_uses_indexes(calls, label):
+    for statement, plan, problems in check_query_plans.check_call(label, calls[label]):
+        assert not problems, f"{' '.join(statement.split())}\n" + '\n'.join(plan)
@@ -0,0 +1,13 @@
+"""Worker start-up cost: every gunicorn worker imports app on (re)start"""
+import os
+import benchmark
+
+# About 215-285 ms measured on the development machines, plus headroom for
+# slower CI runners; raise it only together with a profile showing why
+IMPORT_BUDGET_MS = float(os.getenv('IMPORT_BUDGET_MS', 450))
+
+def test_import_app_within_budget(app, tmp_path):
+    # Against the migrated test database, so the import only checks the schema
+    startup = benchmark.profile_import(str(tmp_path), os.environ['DATABASE_PATH'], runs=5)
+    slowest = ', '.join(f'{name} {ms} ms' for name, ms in startup['slowest'][:5])
+    assert startup['import_ms'] <= IMPORT_BUDGET_MS, f"import app took {startup['import_ms']} ms; slowest: {slowest}"
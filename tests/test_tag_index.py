@@ -0,0 +1,14 @@
+from werkzeug.datastructures import MultiDict
+import tag_index
+
+def test_parse_selection():
+    assert tag_index.parse_selection(MultiDict({'tags': '3, 1,x,,1', 'mode': 'or'})) == ((1, 3), 'or')
+    assert tag_index.parse_selection(MultiDict({'tag': '2', 'mode': 'xor'})) == ((2,), 'and')
+
+def test_parse_selection_skips_non_ascii_digits():
+    # '²' and '٣' pass str.isdigit() but int() rejects the first
+    assert tag_index.parse_selection(MultiDict({'tags': '²,٣,4', 'tag': '²'})) == ((4,), 'and')
+
+def test_pages_with_non_ascii_digit_tags(client):
+    assert client.get('/?tags=%C2%B2').status_code == 200
+    assert client.get('/api/projects?tags=%C2%B2').status_code == 200
@@ -12,6 +12,9 @@ TRANSLATIONS = {
     'github': 'GitHub',
     'my_works': 'Работы',
     'view_details': 'Подробнее',
+    'load_more': 'Показать еще',
+    'match_all_tags': 'Все выбранные теги',
+    'match_any_tag': 'Любой из тегов',
     'view_project': 'Посмотреть проект',
     'projects': {
         1: {